@@ -0,0 +1,21 @@
+import os
+
+
+def configure(db_name: str):
+    """Окружение для src.config_loader без .env с ключами бота.
+
+    config читается при первом импорте, поэтому окружение задаётся до него.
+    """
+    os.environ["DB_NAME"] = db_name
+    os.environ.setdefault("DB_TIMEOUT", "20")
+    for name in ("API_ID", "API_HASH", "BOT_TOKEN", "SUPER_ADMIN_ID"):
+        os.environ.setdefault(name, "0")
+
+
+def load_core(db_name: str):
+    """src.database.core, настроенный на db_name."""
+    configure(db_name)
+
+    from src.database import core
+
+    return core
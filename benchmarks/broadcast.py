@@ -0,0 +1,185 @@
+"""Скорость рассылки на локальном фейковом Bot API.
+
+Сервер на aiohttp отвечает на copyMessage и sendMessage с задержкой, как
+настоящий API, и считает достигнутые сообщ/с. Если за последнюю секунду
+запросов больше --limit, он отвечает 429 с retry_after, как Telegram.
+Сообщения в один чат чаще раза в секунду только считаются: короткий
+всплеск Telegram пропускает.
+
+Сравниваются прежний цикл (copy_message + send_message и sleep(0.05) на
+юзера) и PostDelivery.run из src.services.sender с воркерами и лимитером.
+
+Запуск из корня репозитория: python -m benchmarks.broadcast
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+from benchmarks._env import configure
+
+TOKEN = "1:fake"
+CHAT_INTERVAL = 1.0
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float, limit: int):
+        self.latency = latency
+        self.limit = limit
+        self.recent: deque[float] = deque()
+        self.last_in_chat: dict[int, float] = {}
+        self.per_second: Counter[int] = Counter()
+        self.accepted = 0
+        self.rejected = 0
+        self.chat_bursts = 0
+        self.started = time.monotonic()
+
+    def reset(self):
+        self.recent.clear()
+        self.last_in_chat.clear()
+        self.per_second.clear()
+        self.accepted = 0
+        self.rejected = 0
+        self.chat_bursts = 0
+        self.started = time.monotonic()
+
+    def _over_limit(self, now: float):
+        while self.recent and now - self.recent[0] >= 1:
+            self.recent.popleft()
+        return len(self.recent) >= self.limit
+
+    async def handle(self, request: web.Request):
+        data = await request.post()
+        chat_id = int(str(data["chat_id"]))
+        now = time.monotonic()
+
+        if self._over_limit(now):
+            self.rejected += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            )
+
+        last = self.last_in_chat.get(chat_id)
+        if last is not None and now - last < CHAT_INTERVAL:
+            self.chat_bursts += 1
+        self.recent.append(now)
+        self.last_in_chat[chat_id] = now
+        self.per_second[int(now - self.started)] += 1
+        self.accepted += 1
+        await asyncio.sleep(self.latency)
+
+        method = request.match_info["method"]
+        if method == "copyMessage":
+            return web.json_response({"ok": True, "result": {"message_id": 1}})
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": str(data.get("text", "")),
+                },
+            }
+        )
+
+    def report(self, name: str, elapsed: float, users: int):
+        print(
+            f"{name}: {users} юзеров за {elapsed:.1f} с, принято {self.accepted} "
+            f"запросов ({self.accepted / elapsed:.1f} сообщ/с, пик "
+            f"{max(self.per_second.values(), default=0)} за секунду), "
+            f"отклонено 429: {self.rejected}, в чат чаще 1/с: {self.chat_bursts}"
+        )
+
+
+async def old_loop(bot, users: list[int]):
+    """Прежний broadcast_random_post без обхода защиты и работы с БД."""
+    for user_id in users:
+        try:
+            await bot.copy_message(
+                chat_id=user_id, from_chat_id="@source", message_id=1
+            )
+            await bot.send_message(user_id, "Источник @source")
+        except Exception:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--users", type=int, default=600)
+    args.add_argument("--latency-ms", type=float, default=50)
+    args.add_argument("--limit", type=int, default=30)
+    args.add_argument("--rate", type=float, default=30)
+    args.add_argument("--workers", type=int, default=16)
+    args.add_argument("--single-message", type=int, choices=(0, 1), default=1)
+    opts = args.parse_args()
+
+    # Импорт парсера создаёт сессию telethon в текущей папке
+    workdir = tempfile.mkdtemp()
+    sys.path.insert(0, os.getcwd())
+    os.chdir(workdir)
+    configure(os.path.join(workdir, "bench.db"))
+    os.environ["BROADCAST_RATE"] = str(opts.rate)
+    os.environ["BROADCAST_WORKERS"] = str(opts.workers)
+    os.environ["BROADCAST_SINGLE_MESSAGE"] = str(opts.single_message)
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from src.services import sender
+
+    api = FakeBotAPI(opts.latency_ms / 1000, opts.limit)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+
+    session = AiohttpSession(
+        api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+    )
+    bot = Bot(TOKEN, session=session)
+    users = list(range(1, opts.users + 1))
+
+    print(
+        f"Фейковый Bot API: задержка {opts.latency_ms:.0f} мс, лимит {opts.limit} "
+        f"запросов/с"
+    )
+
+    api.reset()
+    started = time.monotonic()
+    await old_loop(bot, users)
+    api.report("прежний цикл", time.monotonic() - started, len(users))
+
+    api.reset()
+    delivery = sender.PostDelivery(bot, "source", 1)
+    started = time.monotonic()
+    stats = await delivery.run(users)
+    api.report(
+        f"воркеры ({opts.workers}, лимит {opts.rate:.0f}/с)",
+        time.monotonic() - started,
+        len(users),
+    )
+    print(f"  статистика рассылки: {stats}")
+
+    await session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Задержка одного запроса к БД: соединение на каждый вызов против пула.
+
+"До" повторяет прежний get_db_connection: connect, три PRAGMA и close на
+каждый запрос. "После" — те же вызовы через src.database.core на пуле.
+
+Запуск из корня репозитория: python -m benchmarks.db_pool
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from benchmarks._env import load_core
+
+
+async def old_set_user_active(db_name: str, user_id: int, active: bool):
+    db = await aiosqlite.connect(db_name, timeout=20)
+    try:
+        await db.execute("PRAGMA journal_mode=WAL;")
+        await db.execute("PRAGMA synchronous=NORMAL;")
+        await db.execute("PRAGMA foreign_keys=ON;")
+        await db.execute(
+            "UPDATE users SET is_active = ? WHERE user_id = ?", (int(active), user_id)
+        )
+        await db.commit()
+    finally:
+        await db.close()
+
+
+async def old_is_admin(db_name: str, user_id: int):
+    db = await aiosqlite.connect(db_name, timeout=20)
+    try:
+        await db.execute("PRAGMA journal_mode=WAL;")
+        await db.execute("PRAGMA synchronous=NORMAL;")
+        await db.execute("PRAGMA foreign_keys=ON;")
+        async with db.execute(
+            "SELECT is_admin FROM users WHERE user_id = ?", (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return bool(row[0]) if row else False
+    finally:
+        await db.close()
+
+
+async def measure(call, calls: int):
+    timings = []
+    for i in range(calls):
+        started = time.perf_counter()
+        await call(i)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return (
+        statistics.mean(timings) * 1e6,
+        timings[len(timings) // 2] * 1e6,
+        timings[int(len(timings) * 0.99)] * 1e6,
+    )
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--calls", type=int, default=2000)
+    args.add_argument("--users", type=int, default=10_000)
+    opts = args.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_name = os.path.join(workdir, "bench.db")
+    db = load_core(db_name)
+    await db.init_db()
+    async with db.get_db_connection() as conn:
+        await conn.executemany(
+            "INSERT INTO users (user_id) VALUES (?)",
+            [(i,) for i in range(opts.users)],
+        )
+        await conn.commit()
+
+    cases = (
+        (
+            "set_user_active, соединение на вызов",
+            lambda i: old_set_user_active(db_name, i % opts.users, bool(i % 2)),
+        ),
+        (
+            "set_user_active, пул",
+            lambda i: db.set_user_active(i % opts.users, bool(i % 2)),
+        ),
+        (
+            "is_admin, соединение на вызов",
+            lambda i: old_is_admin(db_name, i % opts.users),
+        ),
+        ("is_admin, пул", lambda i: db.is_admin(i % opts.users)),
+    )
+
+    print(f"{opts.calls} вызовов, {opts.users} юзеров в БД")
+    for name, call in cases:
+        mean, p50, p99 = await measure(call, opts.calls)
+        print(f"{name}: среднее {mean:.0f} мкс, p50 {p50:.0f} мкс, p99 {p99:.0f} мкс")
+
+    await db.close_db()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
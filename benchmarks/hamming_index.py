@@ -0,0 +1,91 @@
+"""Задержка поиска дублей и память HammingIndex на 1M хэшей.
+
+Память индекса считается через tracemalloc отдельным построением:
+под ним аллокации заметно медленнее.
+
+Запуск из корня репозитория: python -m benchmarks.hamming_index
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from src.services.hamming import HASH_BITS, HammingIndex
+
+
+def flip_bits(value: int, count: int, rng: random.Random):
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def measure(index: HammingIndex, queries: list[int]):
+    timings = []
+    found = 0
+    for value in queries:
+        started = time.perf_counter()
+        if index.find(value):
+            found += 1
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return (
+        found,
+        statistics.mean(timings) * 1e6,
+        timings[len(timings) // 2] * 1e6,
+        timings[int(len(timings) * 0.99)] * 1e6,
+    )
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--size", type=int, default=1_000_000)
+    args.add_argument("--queries", type=int, default=10_000)
+    args.add_argument("--distance", type=int, default=4)
+    args.add_argument("--seed", type=int, default=0)
+    opts = args.parse_args()
+
+    rng = random.Random(opts.seed)
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(opts.size)]
+
+    index = HammingIndex(opts.distance)
+    started = time.perf_counter()
+    for i, value in enumerate(hashes):
+        index.add(value, i)
+    print(f"Построение: {len(index)} хэшей за {time.perf_counter() - started:.1f} с")
+
+    tracemalloc.start()
+    traced = HammingIndex(opts.distance)
+    for i, value in enumerate(hashes):
+        traced.add(value, i)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    print(f"Память индекса: {size / 2**20:.0f} МБ, пик {peak / 2**20:.0f} МБ")
+
+    near = [
+        flip_bits(rng.choice(hashes), rng.randint(1, opts.distance), rng)
+        for _ in range(opts.queries)
+    ]
+    misses = [rng.getrandbits(HASH_BITS) for _ in range(opts.queries)]
+
+    for name, queries in (("почти дубли", near), ("новые", misses)):
+        found, mean, p50, p99 = measure(index, queries)
+        print(
+            f"{name}: найдено {found}/{len(queries)}, "
+            f"среднее {mean:.1f} мкс, p50 {p50:.1f} мкс, p99 {p99:.1f} мкс"
+        )
+
+    # Для сравнения: полный перебор, которым пришлось бы искать без индекса
+    sample = near[:20]
+    started = time.perf_counter()
+    for value in sample:
+        min((value ^ h).bit_count() for h in hashes)
+    linear = (time.perf_counter() - started) / len(sample) * 1e3
+    print(f"Полный перебор: {linear:.1f} мс на запрос")
+
+
+if __name__ == "__main__":
+    main()
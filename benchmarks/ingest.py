@@ -0,0 +1,78 @@
+"""Скорость записи постов: add_post на каждую строку против add_posts чанками.
+
+Чанки того же размера, что у парсера (PARSE_CHUNK_SIZE), с метаданными и
+сдвигом offset канала в той же транзакции. Каждый способ пишет в свой канал
+пустой БД, чтобы повторная вставка не превращалась в UPDATE.
+
+Запуск из корня репозитория: python -m benchmarks.ingest
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks._env import load_core
+
+# Как parser.PARSE_CHUNK_SIZE: импорт парсера создаёт сессию telethon
+CHUNK_SIZE = 500
+
+
+def post(message_id: int):
+    """Кортеж (message_id, *POST_META_COLUMNS) как у parser.PostMeta фото."""
+    return (message_id, 1, 150_000, None, 1280, 720, None, 40, 1200, 15, None, None, 30)
+
+
+async def per_row(db, username: str, posts: int):
+    for message_id in range(1, posts + 1):
+        await db.add_post(username, message_id)
+
+
+async def chunked(db, username: str, posts: int):
+    for start in range(1, posts + 1, CHUNK_SIZE):
+        chunk = [post(i) for i in range(start, min(start + CHUNK_SIZE, posts + 1))]
+        await db.add_posts(username, chunk, chunk[-1][0])
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--posts", type=int, default=50_000)
+    opts = args.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db = load_core(os.path.join(workdir, "bench.db"))
+    await db.init_db()
+
+    print(f"{opts.posts} постов на канал")
+    for name, ingest in (
+        ("add_post по одному", per_row),
+        ("add_posts чанками", chunked),
+    ):
+        username = ingest.__name__
+        await db.add_channel(username, 0)
+
+        started = time.perf_counter()
+        await ingest(db, username, opts.posts)
+        elapsed = time.perf_counter() - started
+
+        async with db.get_db_connection(readonly=True) as conn:
+            async with conn.execute(
+                """
+                SELECT COUNT(*) FROM posts
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+            """,
+                (username,),
+            ) as cursor:
+                (stored,) = await cursor.fetchone()
+        assert stored == opts.posts, stored
+        print(f"{name}: {elapsed:.1f} с, {opts.posts / elapsed:.0f} постов/с")
+
+    await db.close_db()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
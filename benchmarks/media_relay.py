@@ -0,0 +1,121 @@
+"""Время до первой доставки и пиковый RSS для режимов пересылки медиа.
+
+Скачивание из Telegram и загрузка в Bot API эмулируются чанками с заданной
+скоростью, логика потокового режима — та же src.services.streams.buffered.
+Каждый режим идёт в отдельном процессе, чтобы пиковый RSS не смешивался.
+
+Запуск из корня репозитория: python -m benchmarks.media_relay
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.services.streams import buffered
+
+CHUNK_SIZE = 512 * 1024
+BUFFER_CHUNKS = 8
+MODES = ("disk", "memory", "stream")
+
+
+async def download(size: int, rate: float):
+    """Эмуляция iter_download: чанки со скоростью rate байт/с."""
+    sent = 0
+    while sent < size:
+        chunk = bytes(min(CHUNK_SIZE, size - sent))
+        await asyncio.sleep(len(chunk) / rate)
+        sent += len(chunk)
+        yield chunk
+
+
+async def upload(chunks, rate: float):
+    """Эмуляция загрузки в Bot API со скоростью rate байт/с."""
+    async for chunk in chunks:
+        await asyncio.sleep(len(chunk) / rate)
+
+
+async def read_file(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def run_disk(size: int, down: float, up: float):
+    fd, path = tempfile.mkstemp(dir=".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in download(size, down):
+                f.write(chunk)
+        await upload(read_file(path), up)
+    finally:
+        os.remove(path)
+
+
+async def run_memory(size: int, down: float, up: float):
+    data = b"".join([chunk async for chunk in download(size, down)])
+
+    async def single():
+        yield data
+
+    await upload(single(), up)
+
+
+async def run_stream(size: int, down: float, up: float):
+    await upload(buffered(download(size, down), BUFFER_CHUNKS), up)
+
+
+def run_mode(opts):
+    size = opts.size_mb * 1024 * 1024
+    down = opts.download_mbps * 1024 * 1024
+    up = opts.upload_mbps * 1024 * 1024
+    runner = {"disk": run_disk, "memory": run_memory, "stream": run_stream}[opts.mode]
+
+    started = time.perf_counter()
+    asyncio.run(runner(size, down, up))
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{opts.mode}: до доставки {elapsed:.2f} с, пиковый RSS {peak_mb:.0f} МБ")
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--mode", choices=MODES)
+    args.add_argument("--size-mb", type=int, default=200)
+    args.add_argument("--download-mbps", type=float, default=40)
+    args.add_argument("--upload-mbps", type=float, default=40)
+    opts = args.parse_args()
+
+    if opts.mode:
+        run_mode(opts)
+        return
+
+    print(
+        f"Файл {opts.size_mb} МБ, скачивание {opts.download_mbps} МБ/с, "
+        f"загрузка {opts.upload_mbps} МБ/с"
+    )
+    for mode in MODES:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.media_relay",
+                "--mode",
+                mode,
+                "--size-mb",
+                str(opts.size_mb),
+                "--download-mbps",
+                str(opts.download_mbps),
+                "--upload-mbps",
+                str(opts.upload_mbps),
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Скорость скачивания файла по частям в один и в несколько потоков.
+
+Локальный TCP-сервер отдаёт части файла с задержкой на каждый запрос, как
+upload.getFile. Части собираются тем же src.services.streams.fetch_parallel.
+
+Запуск из корня репозитория: python -m benchmarks.parallel_download
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.services.streams import fetch_parallel
+
+PART_SIZE = 512 * 1024
+
+
+async def serve(latency: float):
+    payload = bytes(PART_SIZE)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Одно соединение — одна сессия, запросы в ней идут по очереди
+        while line := await reader.readline():
+            size = int(line)
+            await asyncio.sleep(latency)
+            writer.write(payload[:size])
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+class Client:
+    """Пул соединений с сервером: по одному на параллельный запрос."""
+
+    def __init__(self, port: int, file_size: int):
+        self.port = port
+        self.file_size = file_size
+        self._free: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def fetch_part(self, index: int):
+        size = min(PART_SIZE, self.file_size - index * PART_SIZE)
+        if self._free:
+            reader, writer = self._free.pop()
+        else:
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+        writer.write(f"{size}\n".encode())
+        data = await reader.readexactly(size)
+        self._free.append((reader, writer))
+        return data
+
+    def close(self):
+        for _, writer in self._free:
+            writer.close()
+
+
+async def measure(port: int, file_size: int, workers: int):
+    client = Client(port, file_size)
+    parts = -(-file_size // PART_SIZE)
+    received = 0
+    started = time.perf_counter()
+    async for chunk in fetch_parallel(client.fetch_part, parts, workers):
+        received += len(chunk)
+    elapsed = time.perf_counter() - started
+    client.close()
+    assert received == file_size
+    return elapsed
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--size-mb", type=int, default=64)
+    args.add_argument("--latency-ms", type=float, default=50)
+    args.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    opts = args.parse_args()
+
+    server = await serve(opts.latency_ms / 1000)
+    port = server.sockets[0].getsockname()[1]
+    file_size = opts.size_mb * 1024 * 1024
+
+    print(f"Файл {opts.size_mb} МБ, задержка {opts.latency_ms:.0f} мс на часть")
+    for workers in opts.workers:
+        elapsed = await measure(port, file_size, workers)
+        print(f"потоков {workers}: {elapsed:.2f} с, {opts.size_mb / elapsed:.1f} МБ/с")
+
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Выбор случайного поста на 1M строк: ORDER BY RANDOM() против выборки по id.
+
+Замеряется плотная таблица и таблица с дырками: удалён целый канал и
+каждый третий пост остальных, как после remove_channel и чистки удалённых.
+Для таблицы с дырками дополнительно проверяется равномерность: доля
+выпадений каждого канала должна совпадать с его долей живых постов.
+
+Запуск из корня репозитория: python -m benchmarks.random_post
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks._env import load_core
+
+CHANNELS = 10
+
+
+async def order_by_random(db):
+    async with db.get_db_connection(readonly=True) as conn:
+        async with conn.execute("""
+            SELECT c.username, p.message_id
+            FROM posts p
+            JOIN channels c ON c.id = p.channel_id
+            ORDER BY RANDOM()
+            LIMIT 1
+        """) as cursor:
+            return await cursor.fetchone()
+
+
+async def measure(pick, calls: int):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await pick()
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return statistics.mean(timings) * 1e3, timings[len(timings) // 2] * 1e3
+
+
+async def report(db, slow_calls: int, fast_calls: int):
+    for name, pick, calls in (
+        ("ORDER BY RANDOM()", lambda: order_by_random(db), slow_calls),
+        ("выборка по id", db.get_random_post, fast_calls),
+    ):
+        mean, p50 = await measure(pick, calls)
+        print(f"  {name}: среднее {mean:.3f} мс, p50 {p50:.3f} мс ({calls} вызовов)")
+
+
+async def uniformity(db, samples: int):
+    async with db.get_db_connection(readonly=True) as conn:
+        async with conn.execute("""
+            SELECT c.username, COUNT(*)
+            FROM posts p
+            JOIN channels c ON c.id = p.channel_id
+            GROUP BY c.username
+        """) as cursor:
+            alive = dict(await cursor.fetchall())
+    total = sum(alive.values())
+
+    hits: Counter[str] = Counter()
+    for _ in range(samples):
+        username, _ = await db.get_random_post()
+        hits[username] += 1
+
+    worst = max(
+        abs(hits[username] / samples - count / total)
+        for username, count in alive.items()
+    )
+    print(
+        f"  равномерность по {samples} выборкам: максимальное отклонение доли "
+        f"канала {worst * 100:.2f} п.п., удалённый канал выпал {hits['ch0']} раз"
+    )
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--posts", type=int, default=1_000_000)
+    args.add_argument("--slow-calls", type=int, default=20)
+    args.add_argument("--fast-calls", type=int, default=5000)
+    args.add_argument("--samples", type=int, default=50_000)
+    opts = args.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db = load_core(os.path.join(workdir, "bench.db"))
+    await db.init_db()
+
+    per_channel = opts.posts // CHANNELS
+    started = time.perf_counter()
+    async with db.get_db_connection() as conn:
+        await conn.executemany(
+            "INSERT INTO channels (username) VALUES (?)",
+            [(f"ch{i}",) for i in range(CHANNELS)],
+        )
+        await conn.executemany(
+            "INSERT INTO posts (channel_id, message_id) VALUES (?, ?)",
+            (
+                (channel + 1, message_id)
+                for channel in range(CHANNELS)
+                for message_id in range(per_channel)
+            ),
+        )
+        await conn.commit()
+    print(f"Заполнение: {opts.posts} постов за {time.perf_counter() - started:.1f} с")
+
+    print("Плотная таблица:")
+    await report(db, opts.slow_calls, opts.fast_calls)
+
+    async with db.get_db_connection() as conn:
+        await conn.execute("DELETE FROM channels WHERE username = 'ch0'")
+        await conn.execute("DELETE FROM posts WHERE id % 3 = 0")
+        await conn.commit()
+        async with conn.execute("SELECT COUNT(*) FROM posts") as cursor:
+            (left,) = await cursor.fetchone()
+    print(f"С дырками ({left} постов из {opts.posts}):")
+    await report(db, opts.slow_calls, opts.fast_calls)
+    await uniformity(db, opts.samples)
+
+    await db.close_db()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Пересборка индекса рейтинга на 1M постов: fetchall в списки против пачек в array.
+
+Пока идёт пересборка, рядом тикает таймер раз в миллисекунду: его самая
+длинная задержка показывает, насколько пересборка держит цикл событий.
+Пиковая память считается через tracemalloc отдельным прогоном.
+
+Запуск из корня репозитория: python -m benchmarks.ranking_rebuild
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks._env import load_core
+
+CHANNELS = 50
+
+
+async def fetchall_rebuild(db, ranking):
+    """Прежняя пересборка: все строки одним fetchall, индекс в list."""
+    async with db.get_db_connection(readonly=True) as conn:
+        async with conn.execute("""
+            SELECT id, channel_id, views, forwards, reactions FROM posts ORDER BY id
+        """) as cursor:
+            rows = await cursor.fetchall()
+
+    sums: dict[int, float] = {}
+    counts: dict[int, int] = {}
+    for _, channel_id, views, forwards, reactions in rows:
+        score = ranking._score(views, forwards, reactions)
+        if score is not None:
+            sums[channel_id] = sums.get(channel_id, 0.0) + score
+            counts[channel_id] = counts.get(channel_id, 0) + 1
+    means = {cid: sums[cid] / counts[cid] for cid in sums}
+
+    post_ids: list[int] = []
+    cumulative: list[float] = []
+    total = 0.0
+    for post_id, channel_id, views, forwards, reactions in rows:
+        total += ranking._weight(
+            means, channel_id, ranking._score(views, forwards, reactions)
+        )
+        post_ids.append(post_id)
+        cumulative.append(total)
+    return post_ids, cumulative
+
+
+async def measure(name: str, rebuild):
+    stalls = []
+    done = False
+
+    async def ticker():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    result = await rebuild()
+    elapsed = time.perf_counter() - started
+    done = True
+    await tick
+
+    # Память отдельным прогоном: tracemalloc заметно замедляет аллокации
+    tracemalloc.start()
+    await rebuild()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"  {name}: {elapsed:.2f} с, самая длинная блокировка цикла "
+        f"{max(stalls) * 1e3:.0f} мс, пик памяти {peak / 2**20:.0f} МБ"
+    )
+    return result
+
+
+async def main():
+    args = argparse.ArgumentParser()
+    args.add_argument("--posts", type=int, default=1_000_000)
+    opts = args.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db = load_core(os.path.join(workdir, "bench.db"))
+    from src.services import ranking
+
+    await db.init_db()
+
+    started = time.perf_counter()
+    async with db.get_db_connection() as conn:
+        await conn.executemany(
+            "INSERT INTO channels (username) VALUES (?)",
+            [(f"ch{i}",) for i in range(CHANNELS)],
+        )
+        await conn.executemany(
+            """
+            INSERT INTO posts (channel_id, message_id, views, forwards, reactions)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            (
+                (
+                    i % CHANNELS + 1,
+                    i,
+                    random.randint(100, 100_000),
+                    random.randint(0, 500),
+                    random.randint(0, 2000),
+                )
+                for i in range(opts.posts)
+            ),
+        )
+        await conn.commit()
+    print(f"Заполнение: {opts.posts} постов за {time.perf_counter() - started:.1f} с")
+
+    old = await measure("fetchall в list", lambda: fetchall_rebuild(db, ranking))
+    await measure("пачками в array", ranking.rebuild)
+
+    assert list(ranking._post_ids) == old[0]
+    worst = max(abs(a - b) for a, b in zip(ranking._cumulative, old[1]))
+    print(f"  расхождение накопленных весов: {worst:.2e}")
+
+    await db.close_db()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,19 +2,39 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from src.config_loader import config
 from src.database import core as db
 from src.handlers import admin_commands, user_commands
 from src.services import logger as L
-from src.services import parser, sender
+from src.services import backfill, dedup, downloads, live, parser, sender, sweeper
 
 logger = logging.getLogger(__name__)
 
+# На сколько секунд запуск может опоздать (занятый цикл событий, пауза процесса)
+MISFIRE_GRACE_TIME = 5 * 60
+
+
+def log_skipped_run(event):
+    reason = (
+        "ещё идёт прошлый запуск"
+        if event.code == EVENT_JOB_MAX_INSTANCES
+        else "опоздал"
+    )
+    logger.warning(
+        f"Пропущен запуск {event.job_id} на {event.scheduled_run_times}: {reason}."
+    )
+
 
 async def main():
     await db.init_db()
+    downloads.collect_garbage()
+    await dedup.load()
+    await backfill.resume_all()
+    live_task = asyncio.create_task(live.start())
+    sweeper_task = asyncio.create_task(sweeper.start())
 
     bot = Bot(token=config.BOT_TOKEN)
     dp = Dispatcher()
@@ -22,9 +42,26 @@ async def main():
     dp.include_router(user_commands.router)
     dp.include_router(admin_commands.router)
 
-    scheduler = AsyncIOScheduler()
+    # Пропущенный слот не догоняется: один запуск вместо пачки и не параллельно
+    # с прошлым, который сам заканчивается до следующего часа
+    scheduler = AsyncIOScheduler(
+        job_defaults={
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": MISFIRE_GRACE_TIME,
+        }
+    )
+    scheduler.add_listener(log_skipped_run, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
 
     scheduler.add_job(parser.daily_parse, "cron", hour="6", minute="0")
+    # Подготовка поста за несколько минут до каждого слота рассылки 8-23
+    scheduler.add_job(
+        sender.stage_next_post,
+        "cron",
+        hour="7-22",
+        minute=str(60 - sender.STAGE_MINUTES),
+        kwargs={"bot": bot},
+    )
     scheduler.add_job(
         sender.broadcast_random_post,
         "cron",
@@ -35,7 +72,14 @@ async def main():
 
     scheduler.start()
 
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        scheduler.shutdown(wait=False)
+        live_task.cancel()
+        sweeper_task.cancel()
+        await live.stop()
+        await db.close_db()
 
 
 if __name__ == "__main__":
@@ -17,6 +17,25 @@ class Config:
     SUPER_ADMIN_ID: str
     DB_NAME: str
     DB_TIMEOUT: float
+    DB_READERS: int
+    ROLE_CACHE_TTL: float
+    BROADCAST_RATE: float
+    BROADCAST_CHAT_INTERVAL: float
+    BROADCAST_WORKERS: int
+    BROADCAST_RETRIES: int
+    BROADCAST_SINGLE_MESSAGE: bool
+    BROADCAST_SPREAD_MINUTES: int
+    PARSE_CONCURRENCY: int
+    PARSE_RATE: float
+    PARSE_RETRIES: int
+    LIVE_INGEST: bool
+    DEDUP: bool
+    DEDUP_DISTANCE: int
+    SWEEP_HOURS: float
+    RANK_BLEND: int
+    DOWNLOAD_CACHE_MB: int
+    RELAY_MODE: str
+    DOWNLOAD_WORKERS: int
 
 
 def load_config():
@@ -52,6 +71,26 @@ def load_config():
         logger.error("Ошибка: DB_TIMEOUT не найдено в .env", exc_info=True)
         raise ValueError("DB_TIMEOUT не найдено в .env")
 
+    db_readers = getenv("DB_READERS", "3")
+    role_cache_ttl = getenv("ROLE_CACHE_TTL", "300")
+    broadcast_rate = getenv("BROADCAST_RATE", "30")
+    broadcast_chat_interval = getenv("BROADCAST_CHAT_INTERVAL", "1")
+    broadcast_workers = getenv("BROADCAST_WORKERS", "16")
+    broadcast_retries = getenv("BROADCAST_RETRIES", "3")
+    broadcast_single_message = getenv("BROADCAST_SINGLE_MESSAGE", "1")
+    broadcast_spread_minutes = getenv("BROADCAST_SPREAD_MINUTES", "55")
+    parse_concurrency = getenv("PARSE_CONCURRENCY", "3")
+    parse_rate = getenv("PARSE_RATE", "3")
+    parse_retries = getenv("PARSE_RETRIES", "3")
+    live_ingest = getenv("LIVE_INGEST", "1")
+    dedup = getenv("DEDUP", "1")
+    dedup_distance = getenv("DEDUP_DISTANCE", "4")
+    sweep_hours = getenv("SWEEP_HOURS", "24")
+    rank_blend = getenv("RANK_BLEND", "70")
+    download_cache_mb = getenv("DOWNLOAD_CACHE_MB", "1024")
+    relay_mode = getenv("RELAY_MODE", "stream")
+    download_workers = getenv("DOWNLOAD_WORKERS", "4")
+
     return Config(
         API_ID=api_id,
         API_HASH=api_hash,
@@ -59,6 +98,25 @@ def load_config():
         SUPER_ADMIN_ID=super_admin_id,
         DB_NAME=db_name,
         DB_TIMEOUT=float(db_timeout),
+        DB_READERS=int(db_readers),
+        ROLE_CACHE_TTL=float(role_cache_ttl),
+        BROADCAST_RATE=float(broadcast_rate),
+        BROADCAST_CHAT_INTERVAL=float(broadcast_chat_interval),
+        BROADCAST_WORKERS=int(broadcast_workers),
+        BROADCAST_RETRIES=int(broadcast_retries),
+        BROADCAST_SINGLE_MESSAGE=broadcast_single_message == "1",
+        BROADCAST_SPREAD_MINUTES=int(broadcast_spread_minutes),
+        PARSE_CONCURRENCY=int(parse_concurrency),
+        PARSE_RATE=float(parse_rate),
+        PARSE_RETRIES=int(parse_retries),
+        LIVE_INGEST=live_ingest == "1",
+        DEDUP=dedup == "1",
+        DEDUP_DISTANCE=int(dedup_distance),
+        SWEEP_HOURS=float(sweep_hours),
+        RANK_BLEND=int(rank_blend),
+        DOWNLOAD_CACHE_MB=int(download_cache_mb),
+        RELAY_MODE=relay_mode,
+        DOWNLOAD_WORKERS=int(download_workers),
     )
 
 
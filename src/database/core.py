@@ -1,62 +1,116 @@
+import asyncio
 import logging
+import random
 from contextlib import asynccontextmanager
 
 import aiosqlite
 
 from src.config_loader import config
+from src.database import migrations
 
 logger = logging.getLogger(__name__)
 
+RANDOM_POST_ATTEMPTS = 32
 
-@asynccontextmanager
-async def get_db_connection():
+# Порядок полей совпадает с parser.PostMeta после message_id
+POST_META_COLUMNS = (
+    "media_type",
+    "file_size",
+    "duration",
+    "width",
+    "height",
+    "grouped_id",
+    "caption_len",
+    "views",
+    "forwards",
+    "album_ids",
+    "phash",
+    "reactions",
+)
+
+# Поля, которые у альбома сведены по всем частям. Метаданные одной части
+# (без album_ids) их не перезаписывают: остальные части уже удалены склейкой
+ALBUM_META_COLUMNS = (
+    "media_type",
+    "file_size",
+    "duration",
+    "caption_len",
+    "views",
+    "forwards",
+    "album_ids",
+    "reactions",
+)
+
+_writer: aiosqlite.Connection | None = None
+_write_lock = asyncio.Lock()
+_readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+_all_readers: list[aiosqlite.Connection] = []
+
+
+async def _open_connection():
     db = await aiosqlite.connect(config.DB_NAME, timeout=config.DB_TIMEOUT)
+    await db.execute("PRAGMA journal_mode=WAL;")
+    await db.execute("PRAGMA synchronous=NORMAL;")
+    await db.execute("PRAGMA foreign_keys=ON;")
+    return db
+
+
+async def open_pool():
+    global _writer
+
+    if _writer is not None:
+        return
+
+    logger.info(f"Открытие пула соединений с БД (читателей: {config.DB_READERS}).")
+    _writer = await _open_connection()
+    for _ in range(config.DB_READERS):
+        reader = await _open_connection()
+        _all_readers.append(reader)
+        _readers.put_nowait(reader)
+
+
+async def close_db():
+    global _writer
+
+    logger.info("Закрытие пула соединений с БД.")
+    while _all_readers:
+        await _all_readers.pop().close()
+    while not _readers.empty():
+        _readers.get_nowait()
+
+    if _writer is not None:
+        async with _write_lock:
+            await _writer.close()
+            _writer = None
 
-    try:
-        await db.execute("PRAGMA journal_model=WAL;")
-        await db.execute("PRAGMA synchronous=NORMAL;")
-        await db.execute("PRAGMA foreign_keys=ON;")
 
-        yield db
-    finally:
-        await db.close()
+@asynccontextmanager
+async def get_db_connection(readonly: bool = False):
+    if _writer is None:
+        await open_pool()
+
+    if readonly:
+        reader = await _readers.get()
+        try:
+            yield reader
+        finally:
+            _readers.put_nowait(reader)
+        return
+
+    async with _write_lock:
+        assert _writer is not None
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
 
 
 async def init_db():
     logger.info("Начинаю инициализацию БД.")
+    await open_pool()
     async with get_db_connection() as db:
-        await db.execute("PRAGMA journal_mode=WAL;")
-        await db.execute("PRAGMA foreign_keys=ON;")
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                is_active INTEGER DEFAULT 1,
-                is_admin INTEGER DEFAULT 0,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                added_by INTEGER,
-                last_parsed_id INTEGER DEFAULT 0,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_username TEXT,
-                message_id INTEGER,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        await db.commit()
+        await migrations.run_migrations(db)
     logger.info("БД успешно инициализирована (WAL mode)")
 
 
@@ -95,7 +149,7 @@ async def set_user_active(user_id: int, active: bool = False):
 async def get_active_users():
     logger.debug("Получение всех активных юзеров.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
                 "SELECT user_id FROM users WHERE is_active = 1"
             ) as cursor:
@@ -107,7 +161,7 @@ async def get_active_users():
 async def get_inactive_users():
     logger.debug("Получение всех не активных юзеров.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
                 "SELECT user_id FROM users WHERE is_active = 0"
             ) as cursor:
@@ -121,7 +175,7 @@ async def get_inactive_users():
 async def get_users_stats():
     logger.debug("Получение всех юзеров для статистики.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
                 "SELECT COUNT(*) FROM users WHERE is_active = 1"
             ) as cursor:
@@ -140,7 +194,7 @@ async def get_users_stats():
 async def is_admin(user_id: int):
     logger.debug(f"Проверка, является ли юзер {user_id} админом.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
                 "SELECT is_admin FROM users WHERE user_id = ?", (user_id,)
             ) as cursor:
@@ -156,7 +210,7 @@ async def is_admin(user_id: int):
 async def get_admins():
     logger.debug("Получение всех админов")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
                 "SELECT user_id FROM users WHERE is_admin = 1"
             ) as cursor:
@@ -192,22 +246,31 @@ async def remove_admin(user_id: int):
 async def get_channel(username: str):
     logger.debug("Получение всех каналов.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
-                "SELECT added_by FROM channels WHERE username = ?", (username,)
+                "SELECT added_by, tg_id FROM channels WHERE username = ?", (username,)
             ) as cursor:
                 return await cursor.fetchone()
     except Exception as e:
         logger.error(f"Ошибка при получении всех каналов: {e}", exc_info=True)
 
 
-async def add_channel(username: str, admin_id: int):
-    logger.info(f"Добавление канала {username} админом {admin_id}.")
+async def add_channel(
+    username: str,
+    admin_id: int,
+    tg_id: int | None = None,
+    noforwards: bool = False,
+):
+    logger.info(f"Добавление канала {username} ({tg_id}) админом {admin_id}.")
     try:
         async with get_db_connection() as db:
             await db.execute(
-                "INSERT OR IGNORE INTO channels (username, added_by) VALUES (?, ?)",
-                (username, admin_id),
+                """
+                INSERT OR IGNORE INTO channels
+                    (username, added_by, tg_id, noforwards, protection_checked_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+                (username, admin_id, tg_id, int(noforwards)),
             )
             await db.commit()
     except Exception as e:
@@ -218,21 +281,27 @@ async def add_channel(username: str, admin_id: int):
 
 
 async def remove_channel(username: str, admin_id: int):
+    """Возвращает строки (id, phash) постов канала с хэшем или None, если канала нет."""
     logger.info(f"Удаление канала {username} админом {admin_id}.")
     try:
         async with get_db_connection() as db:
             async with db.execute(
-                "SELECT 1 FROM channels WHERE username = ?", (username,)
+                """
+                SELECT p.id, p.phash
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ? AND p.phash IS NOT NULL
+            """,
+                (username,),
             ) as cursor:
-                if not await cursor.fetchone():
-                    return False
-
-            await db.execute(
-                "DELETE FROM posts WHERE channel_username = ?", (username,)
-            )
-            await db.execute("DELETE FROM channels WHERE username = ?", (username,))
+                hashes = await cursor.fetchall()
+            # Посты и file_id канала удаляются каскадно (ON DELETE CASCADE)
+            async with db.execute(
+                "DELETE FROM channels WHERE username = ?", (username,)
+            ) as cursor:
+                removed = cursor.rowcount > 0
             await db.commit()
-            return True
+            return hashes if removed else None
     except Exception as e:
         logger.error(
             f"Ошибка при удаление канала {username} админом {admin_id}: {e}",
@@ -243,9 +312,9 @@ async def remove_channel(username: str, admin_id: int):
 async def get_all_channels():
     logger.debug("Получение всех каналов.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
-                "SELECT username, last_parsed_id FROM channels"
+                "SELECT username, last_parsed_id, tg_id FROM channels"
             ) as cursor:
                 return await cursor.fetchall()
     except Exception as e:
@@ -255,12 +324,13 @@ async def get_all_channels():
 async def get_channels_stats():
     logger.debug("Получение всех каналов и постов для статистики.")
     try:
-        async with get_db_connection() as db:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute("""
-                SELECT c.username, COUNT(p.id)
+                SELECT c.username, COUNT(p.id), c.noforwards,
+                       c.copy_failures, c.copy_skipped
                 FROM channels c
-                LEFT JOIN posts p ON c.username = p.channel_username
-                GROUP BY c.username
+                LEFT JOIN posts p ON p.channel_id = c.id
+                GROUP BY c.id
             """) as cursor:
                 return await cursor.fetchall()
     except Exception as e:
@@ -270,6 +340,96 @@ async def get_channels_stats():
         )
 
 
+async def set_channel_protection(username: str, noforwards: bool):
+    logger.debug(f"Обновление защиты от копирования канала {username}: {noforwards}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                UPDATE channels
+                SET noforwards = ?, protection_checked_at = CURRENT_TIMESTAMP
+                WHERE username = ?
+            """,
+                (int(noforwards), username),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при обновлении защиты от копирования канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+async def is_channel_protected(username: str):
+    logger.debug(f"Проверка защиты от копирования канала {username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                "SELECT noforwards FROM channels WHERE username = ?", (username,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return bool(row[0]) if row else False
+    except Exception as e:
+        logger.error(
+            f"Ошибка при проверке защиты от копирования канала {username}: {e}",
+            exc_info=True,
+        )
+        return False
+
+
+async def add_copy_stats(username: str, failures: int, skipped: int):
+    logger.debug(
+        f"Счётчики копирования канала {username}: ошибок {failures}, пропущено {skipped}."
+    )
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                UPDATE channels
+                SET copy_failures = copy_failures + ?, copy_skipped = copy_skipped + ?
+                WHERE username = ?
+            """,
+                (failures, skipped, username),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при обновлении счётчиков копирования канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_channel_username(tg_id: int):
+    logger.debug(f"Получение username канала {tg_id}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                "SELECT username FROM channels WHERE tg_id = ?", (tg_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении username канала {tg_id}: {e}", exc_info=True
+        )
+
+
+async def get_channel_offset(username: str):
+    logger.debug(f"Получение последнего айди для парсинга канала {username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                "SELECT last_parsed_id FROM channels WHERE username = ?", (username,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении последнего айди для парсинга канала {username}: {e}",
+            exc_info=True,
+        )
+
+
 async def update_channel_offset(username: str, last_id: int):
     logger.info(
         f"Обновление последнего айди ({last_id}) для парсинга канала {username}."
@@ -288,13 +448,63 @@ async def update_channel_offset(username: str, last_id: int):
         )
 
 
+async def set_channel_peer(username: str, tg_id: int, access_hash: int | None):
+    logger.info(f"Сохранение telegram id {tg_id} и access hash для канала {username}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                "UPDATE channels SET tg_id = ?, access_hash = ? WHERE username = ?",
+                (tg_id, access_hash, username),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при сохранении telegram id {tg_id} для канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_channel_peer(username: str):
+    logger.debug(f"Получение telegram id и access hash канала {username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                "SELECT tg_id, access_hash FROM channels WHERE username = ?",
+                (username,),
+            ) as cursor:
+                return await cursor.fetchone()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении telegram id и access hash канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+async def rename_channel(tg_id: int, username: str):
+    logger.info(f"Смена username канала {tg_id} на {username}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                "UPDATE channels SET username = ? WHERE tg_id = ?", (username, tg_id)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при смене username канала {tg_id} на {username}: {e}",
+            exc_info=True,
+        )
+
+
 async def add_post(channel_username: str, message_id: int):
     logger.info(f"Добавление поста {message_id} канала {channel_username}.")
     try:
         async with get_db_connection() as db:
             await db.execute(
-                "INSERT OR IGNORE INTO posts (channel_username, message_id) VALUES (?, ?)",
-                (channel_username, message_id),
+                """
+                INSERT OR IGNORE INTO posts (channel_id, message_id)
+                SELECT id, ? FROM channels WHERE username = ?
+            """,
+                (message_id, channel_username),
             )
             await db.commit()
     except Exception as e:
@@ -304,48 +514,756 @@ async def add_post(channel_username: str, message_id: int):
         )
 
 
+async def add_posts(
+    channel_username: str, posts: list[tuple], last_id: int | None = None
+):
+    """posts: кортежи (message_id, *POST_META_COLUMNS), например parser.PostMeta.
+
+    Возвращает строки (id, phash) записанных постов с хэшем или None при ошибке.
+    """
+    logger.info(
+        f"Добавление {len(posts)} постов канала {channel_username} (offset {last_id})."
+    )
+    try:
+        async with get_db_connection() as db:
+            async with db.execute(
+                "SELECT id FROM channels WHERE username = ?", (channel_username,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if not row:
+                logger.warning(f"Канал {channel_username} не найден в базе.")
+                return None
+            channel_id = row[0]
+
+            # Повторный парсинг освежает метаданные (просмотры, пересылки)
+            columns = ", ".join(POST_META_COLUMNS)
+            updates = ", ".join(
+                f"""{c} = CASE
+                    WHEN posts.album_ids IS NOT NULL AND excluded.album_ids IS NULL
+                    THEN posts.{c} ELSE excluded.{c} END"""
+                if c in ALBUM_META_COLUMNS
+                else f"{c} = excluded.{c}"
+                for c in POST_META_COLUMNS
+            )
+            placeholders = ", ".join("?" * (len(POST_META_COLUMNS) + 2))
+            await db.executemany(
+                f"""
+                INSERT INTO posts (channel_id, message_id, {columns})
+                VALUES ({placeholders})
+                ON CONFLICT (channel_id, message_id) DO UPDATE SET {updates}
+            """,
+                [(channel_id, *post) for post in posts],
+            )
+            if last_id is not None:
+                await db.execute(
+                    """
+                    UPDATE channels SET last_parsed_id = MAX(last_parsed_id, ?)
+                    WHERE id = ?
+                """,
+                    (last_id, channel_id),
+                )
+
+            stored = []
+            if posts:
+                message_ids = [post[0] for post in posts]
+                async with db.execute(
+                    f"""
+                    SELECT id, phash FROM posts
+                    WHERE channel_id = ? AND phash IS NOT NULL
+                      AND message_id IN ({", ".join("?" * len(message_ids))})
+                """,
+                    (channel_id, *message_ids),
+                ) as cursor:
+                    stored = await cursor.fetchall()
+            await db.commit()
+            return stored
+    except Exception as e:
+        logger.error(
+            f"Ошибка при добавлении {len(posts)} постов канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
 async def get_random_post():
     logger.debug("Получение рандомного поста.")
     try:
-        async with get_db_connection() as db:
-            async with db.execute("""
-                SELECT channel_username, message_id
-                FROM posts
-                ORDER BY RANDOM()
-                LIMIT 1
-            """) as cursor:
+        async with get_db_connection(readonly=True) as db:
+            # MIN и MAX в одном SELECT сканируют таблицу, подзапросы берут края индекса
+            async with db.execute(
+                "SELECT (SELECT MIN(id) FROM posts), (SELECT MAX(id) FROM posts)"
+            ) as cursor:
+                min_id, max_id = await cursor.fetchone()
+            if min_id is None:
+                return None
+
+            # Равномерная выборка по id с повтором на дырках от удалённых постов
+            for _ in range(RANDOM_POST_ATTEMPTS):
+                async with db.execute(
+                    """
+                    SELECT c.username, p.message_id
+                    FROM posts p
+                    JOIN channels c ON c.id = p.channel_id
+                    WHERE p.id = ?
+                """,
+                    (random.randint(min_id, max_id),),
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if row:
+                    return row
+
+            # Таблица слишком разрежена, берём случайное смещение
+            logger.warning("Слишком много дырок в id постов, выборка по смещению.")
+            async with db.execute("SELECT COUNT(*) FROM posts") as cursor:
+                total = (await cursor.fetchone())[0]
+            if not total:
+                return None
+            async with db.execute(
+                """
+                SELECT c.username, p.message_id
+                FROM (SELECT channel_id, message_id FROM posts LIMIT 1 OFFSET ?) p
+                JOIN channels c ON c.id = p.channel_id
+            """,
+                (random.randrange(total),),
+            ) as cursor:
                 return await cursor.fetchone()
     except Exception as e:
         logger.error(f"Ошибка при получении рандомного поста: {e}", exc_info=True)
 
 
-async def get_all_posts():
-    logger.debug("Получение всех постов.")
+async def get_post_by_id(post_id: int):
+    logger.debug(f"Получение поста {post_id}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT c.username, p.message_id
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE p.id = ?
+            """,
+                (post_id,),
+            ) as cursor:
+                return await cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Ошибка при получении поста {post_id}: {e}", exc_info=True)
+
+
+async def get_posts_engagement(after_id: int, limit: int):
+    logger.debug(f"Получение охватов постов после {after_id}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT id, channel_id, views, forwards, reactions
+                FROM posts
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """,
+                (after_id, limit),
+            ) as cursor:
+                return await cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Ошибка при получении охватов постов: {e}", exc_info=True)
+
+
+async def get_channel_score_means(forward_weight: int, reaction_weight: int):
+    """Средний score поста по каналам: (channel_id, среднее) для постов с охватами."""
+    logger.debug("Получение средних охватов каналов.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT channel_id,
+                       AVG(views + ? * IFNULL(forwards, 0) + ? * IFNULL(reactions, 0))
+                FROM posts
+                WHERE views IS NOT NULL
+                GROUP BY channel_id
+            """,
+                (forward_weight, reaction_weight),
+            ) as cursor:
+                return await cursor.fetchall()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении средних охватов каналов: {e}", exc_info=True
+        )
+
+
+async def update_posts_engagement(channel_username: str, rows: list[tuple]):
+    """rows: (message_id, views, forwards, reactions)."""
+    logger.debug(f"Обновление охватов {len(rows)} постов канала {channel_username}.")
     try:
         async with get_db_connection() as db:
+            await db.executemany(
+                """
+                UPDATE posts SET views = ?, forwards = ?, reactions = ?
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id = ?
+            """,
+                [
+                    (views, forwards, reactions, channel_username, message_id)
+                    for message_id, views, forwards, reactions in rows
+                ],
+            )
+            await db.commit()
+            return True
+    except Exception as e:
+        logger.error(
+            f"Ошибка при обновлении охватов постов канала {channel_username}: {e}",
+            exc_info=True,
+        )
+        return False
+
+
+async def get_setting(key: str):
+    logger.debug(f"Получение настройки {key}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
             async with db.execute(
-                "SELECT channel_username, message_id FROM posts"
+                "SELECT value FROM settings WHERE key = ?", (key,)
             ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Ошибка при получении настройки {key}: {e}", exc_info=True)
+
+
+async def set_setting(key: str, value: str):
+    logger.info(f"Изменение настройки {key} на {value}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                INSERT INTO settings (key, value) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """,
+                (key, value),
+            )
+            await db.commit()
+            return True
+    except Exception as e:
+        logger.error(f"Ошибка при изменении настройки {key}: {e}", exc_info=True)
+        return False
+
+
+async def add_broadcast(
+    channel_username: str,
+    message_id: int,
+    *,
+    total: int,
+    sent: int,
+    blocked: int,
+    failed: int,
+    retries: int,
+    flood_waits: int,
+    flood_wait_seconds: float,
+    duration: float,
+    prepare_duration: float = 0.0,
+    staged: bool = False,
+    first_delivery: float | None = None,
+    api_calls: int = 0,
+    peak_rate: float = 0.0,
+):
+    logger.debug(
+        f"Сохранение итогов рассылки поста {message_id} канала {channel_username}."
+    )
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                INSERT INTO broadcasts (
+                    channel_username, message_id, total, sent, blocked, failed,
+                    retries, flood_waits, flood_wait_seconds, duration,
+                    prepare_duration, staged, first_delivery, api_calls, peak_rate
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    channel_username,
+                    message_id,
+                    total,
+                    sent,
+                    blocked,
+                    failed,
+                    retries,
+                    flood_waits,
+                    flood_wait_seconds,
+                    duration,
+                    prepare_duration,
+                    int(staged),
+                    first_delivery,
+                    api_calls,
+                    peak_rate,
+                ),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при сохранении итогов рассылки поста {message_id} канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_broadcasts_stats(days: int = 1):
+    logger.debug(f"Получение итогов рассылок за {days} дн.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(sent), 0), COALESCE(SUM(blocked), 0),
+                       COALESCE(SUM(failed), 0), COALESCE(SUM(flood_waits), 0),
+                       COALESCE(SUM(flood_wait_seconds), 0),
+                       COALESCE(SUM(duration), 0),
+                       COALESCE(SUM(staged), 0),
+                       AVG(prepare_duration),
+                       AVG(
+                           CASE WHEN staged THEN 0 ELSE prepare_duration END
+                           + first_delivery
+                       ),
+                       MAX(peak_rate),
+                       SUM(api_calls) / SUM(
+                           CASE WHEN api_calls IS NOT NULL THEN duration END
+                       )
+                FROM broadcasts
+                WHERE finished_at >= datetime('now', ?)
+            """,
+                (f"-{days} days",),
+            ) as cursor:
+                row = await cursor.fetchone()
+        keys = (
+            "count",
+            "sent",
+            "blocked",
+            "failed",
+            "flood_waits",
+            "flood_wait_seconds",
+            "duration",
+            "staged",
+            "avg_prepare",
+            "avg_first_delivery",
+            "peak_rate",
+            "avg_rate",
+        )
+        return dict(zip(keys, row))
+    except Exception as e:
+        logger.error(f"Ошибка при получении итогов рассылок: {e}", exc_info=True)
+
+
+async def get_all_posts():
+    logger.debug("Получение всех постов.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute("""
+                SELECT c.username, p.message_id
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+            """) as cursor:
                 return await cursor.fetchall()
     except Exception as e:
         logger.error(f"Ошибка при получении всех постов: {e}", exc_info=True)
 
 
 async def delete_post(channel_username: str, message_id: int):
+    """Возвращает строки (id, phash) удалённого поста: пустой список, если его не было."""
     logger.info(f"Удаление поста {message_id} с канала {channel_username}.")
     try:
         async with get_db_connection() as db:
             async with db.execute(
                 """
                 DELETE FROM posts
-                WHERE channel_username = ? AND message_id = ?
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id = ?
+                RETURNING id, phash
             """,
                 (channel_username, message_id),
+            ) as cursor:
+                deleted = await cursor.fetchall()
+            await db.execute(
+                """
+                DELETE FROM media_cache
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id = ?
+            """,
+                (channel_username, message_id),
+            )
+            await db.commit()
+            return deleted
+    except Exception as e:
+        logger.error(
+            f"Ошибка при удалении поста {message_id} с канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def delete_posts(channel_username: str, message_ids: list[int]):
+    """Удаляет посты пачкой, возвращает строки (id, phash) удалённых."""
+    logger.info(f"Удаление {len(message_ids)} постов с канала {channel_username}.")
+    try:
+        async with get_db_connection() as db:
+            placeholders = ", ".join("?" * len(message_ids))
+            async with db.execute(
+                f"""
+                DELETE FROM posts
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id IN ({placeholders})
+                RETURNING id, phash
+            """,
+                (channel_username, *message_ids),
+            ) as cursor:
+                deleted = await cursor.fetchall()
+            await db.execute(
+                f"""
+                DELETE FROM media_cache
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id IN ({placeholders})
+            """,
+                (channel_username, *message_ids),
+            )
+            await db.commit()
+            return deleted
+    except Exception as e:
+        logger.error(
+            f"Ошибка при удалении {len(message_ids)} постов с канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_post_parts(channel_username: str, after_id: int, limit: int):
+    """Строки (message_id, album_ids) постов канала после after_id."""
+    logger.debug(f"Получение частей постов канала {channel_username} после {after_id}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT p.message_id, p.album_ids
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ? AND p.message_id > ?
+                ORDER BY p.message_id
+                LIMIT ?
+            """,
+                (channel_username, after_id, limit),
+            ) as cursor:
+                return await cursor.fetchall()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении частей постов канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_post_ids(channel_username: str, after_id: int, limit: int):
+    logger.debug(f"Получение id постов канала {channel_username} после {after_id}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT p.message_id
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ? AND p.message_id > ?
+                ORDER BY p.message_id
+                LIMIT ?
+            """,
+                (channel_username, after_id, limit),
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении id постов канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_media_cache(channel_username: str, message_id: int):
+    logger.debug(f"Получение file_id поста {message_id} канала {channel_username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT m.file_id, m.media_type, m.caption
+                FROM media_cache m
+                JOIN channels c ON c.id = m.channel_id
+                WHERE c.username = ? AND m.message_id = ?
+            """,
+                (channel_username, message_id),
+            ) as cursor:
+                return await cursor.fetchone()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении file_id поста {message_id} канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def set_media_cache(
+    channel_username: str,
+    message_id: int,
+    file_id: str,
+    media_type: str,
+    caption: str | None,
+):
+    """False, если запись не сохранена: канала ещё нет в базе или ошибка."""
+    logger.info(f"Сохранение file_id поста {message_id} канала {channel_username}.")
+    try:
+        async with get_db_connection() as db:
+            async with db.execute(
+                """
+                INSERT OR REPLACE INTO media_cache
+                    (channel_id, message_id, file_id, media_type, caption)
+                SELECT id, ?, ?, ?, ? FROM channels WHERE username = ?
+            """,
+                (message_id, file_id, media_type, caption, channel_username),
+            ) as cursor:
+                saved = cursor.rowcount > 0
+            await db.commit()
+            if not saved:
+                logger.warning(
+                    f"file_id поста {message_id} не сохранён: канала {channel_username} нет в базе."
+                )
+            return saved
+    except Exception as e:
+        logger.error(
+            f"Ошибка при сохранении file_id поста {message_id} канала {channel_username}: {e}",
+            exc_info=True,
+        )
+        return False
+
+
+async def delete_media_cache(channel_username: str, message_id: int):
+    logger.info(f"Удаление file_id поста {message_id} канала {channel_username}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                DELETE FROM media_cache
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+                  AND message_id = ?
+            """,
+                (channel_username, message_id),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при удалении file_id поста {message_id} канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def start_backfill_job(username: str, target_id: int):
+    logger.info(f"Запуск бэкфилла канала {username} до поста {target_id}.")
+    try:
+        async with get_db_connection() as db:
+            async with db.execute(
+                """
+                INSERT INTO backfill_jobs (channel_id, status, target_id)
+                SELECT id, 'running', ? FROM channels WHERE username = ?
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    status = 'running',
+                    target_id = excluded.target_id,
+                    error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            """,
+                (target_id, username),
             ) as cursor:
                 await db.commit()
                 return cursor.rowcount > 0
     except Exception as e:
         logger.error(
-            f"Ошибка при удалении поста {message_id} с канала {channel_username}: {e}",
+            f"Ошибка при запуске бэкфилла канала {username}: {e}", exc_info=True
+        )
+        return False
+
+
+async def update_backfill_job(username: str, scanned: int, added: int):
+    logger.debug(f"Прогресс бэкфилла канала {username}: +{scanned}/+{added}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                UPDATE backfill_jobs
+                SET scanned = scanned + ?, added = added + ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+            """,
+                (scanned, added, username),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при обновлении прогресса бэкфилла канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+async def finish_backfill_job(username: str, status: str, error: str | None = None):
+    logger.info(f"Бэкфилл канала {username} завершен со статусом {status}.")
+    try:
+        async with get_db_connection() as db:
+            await db.execute(
+                """
+                UPDATE backfill_jobs
+                SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE channel_id = (SELECT id FROM channels WHERE username = ?)
+            """,
+                (status, error, username),
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(
+            f"Ошибка при завершении бэкфилла канала {username}: {e}", exc_info=True
+        )
+
+
+async def get_backfill_jobs(status: str | None = None):
+    logger.debug(f"Получение бэкфиллов (статус {status or 'любой'}).")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT c.username, j.status, c.last_parsed_id, j.target_id,
+                       j.scanned, j.added, j.error, j.updated_at
+                FROM backfill_jobs j
+                JOIN channels c ON c.id = j.channel_id
+                WHERE ? IS NULL OR j.status = ?
+                ORDER BY j.started_at
+            """,
+                (status, status),
+            ) as cursor:
+                return await cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Ошибка при получении бэкфиллов: {e}", exc_info=True)
+
+
+async def get_post_meta(channel_username: str, message_id: int):
+    logger.debug(f"Получение метаданных поста {message_id} канала {channel_username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                f"""
+                SELECT {", ".join(f"p.{c}" for c in POST_META_COLUMNS)}
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ? AND p.message_id = ?
+            """,
+                (channel_username, message_id),
+            ) as cursor:
+                row = await cursor.fetchone()
+                return dict(zip(POST_META_COLUMNS, row)) if row else None
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении метаданных поста {message_id} канала {channel_username}: {e}",
+            exc_info=True,
+        )
+
+
+async def get_posts_without_meta(channel_username: str, after_id: int, limit: int):
+    logger.debug(f"Получение постов без метаданных канала {channel_username}.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute(
+                """
+                SELECT p.message_id
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ?
+                    AND (p.media_type IS NULL OR p.phash IS NULL)
+                    AND p.message_id > ?
+                ORDER BY p.message_id
+                LIMIT ?
+            """,
+                (channel_username, after_id, limit),
+            ) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+    except Exception as e:
+        logger.error(
+            f"Ошибка при получении постов без метаданных канала {channel_username}: {e}",
             exc_info=True,
         )
+
+
+async def get_post_hashes():
+    logger.debug("Получение хэшей медиа постов.")
+    try:
+        async with get_db_connection(readonly=True) as db:
+            async with db.execute("""
+                SELECT id, phash FROM posts
+                WHERE phash IS NOT NULL
+                ORDER BY id
+            """) as cursor:
+                return await cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Ошибка при получении хэшей медиа постов: {e}", exc_info=True)
+
+
+async def collapse_albums(album_type: int):
+    """Сводит части альбомов, сохранённые отдельными постами, в одну запись.
+
+    Метаданные сводятся так же, как parser.group_albums. Возвращает строки
+    (id, phash) удалённых частей или None при ошибке.
+    """
+    logger.info("Склейка альбомов, сохранённых по частям.")
+    try:
+        async with get_db_connection() as db:
+            async with db.execute("""
+                SELECT id, channel_id, grouped_id, message_id, album_ids, phash,
+                       file_size, duration, caption_len, views, forwards, reactions
+                FROM posts
+                WHERE grouped_id IS NOT NULL
+                ORDER BY channel_id, grouped_id, message_id
+            """) as cursor:
+                rows = await cursor.fetchall()
+
+            groups: dict[tuple[int, int], list] = {}
+            for row in rows:
+                groups.setdefault((row[1], row[2]), []).append(row)
+
+            def total(values):
+                values = [v for v in values if v is not None]
+                return sum(values) if values else None
+
+            def largest(values):
+                values = [v for v in values if v is not None]
+                return max(values) if values else None
+
+            updates = []
+            deleted: list[tuple[int, int | None]] = []
+            for parts in groups.values():
+                if len(parts) < 2:
+                    continue
+                ids: set[int] = set()
+                for part in parts:
+                    ids.add(part[3])
+                    if part[4]:
+                        ids.update(int(i) for i in part[4].split(","))
+                columns = list(zip(*parts))
+                updates.append(
+                    (
+                        album_type,
+                        ",".join(map(str, sorted(ids))),
+                        total(columns[6]),
+                        total(columns[7]),
+                        largest(columns[8]),
+                        largest(columns[9]),
+                        largest(columns[10]),
+                        largest(columns[11]),
+                        parts[0][0],
+                    )
+                )
+                deleted.extend((part[0], part[5]) for part in parts[1:])
+
+            await db.executemany(
+                """
+                UPDATE posts
+                SET media_type = ?, album_ids = ?, file_size = ?, duration = ?,
+                    caption_len = ?, views = ?, forwards = ?, reactions = ?
+                WHERE id = ?
+            """,
+                updates,
+            )
+            await db.executemany(
+                "DELETE FROM posts WHERE id = ?", [(post_id,) for post_id, _ in deleted]
+            )
+            await db.commit()
+            return deleted
+    except Exception as e:
+        logger.error(f"Ошибка при склейке альбомов: {e}", exc_info=True)
@@ -0,0 +1,266 @@
+import logging
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+async def _initial_schema(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            is_active INTEGER DEFAULT 1,
+            is_admin INTEGER DEFAULT 0,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            added_by INTEGER,
+            last_parsed_id INTEGER DEFAULT 0,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_username TEXT,
+            message_id INTEGER,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+async def _unique_posts_and_indexes(db: aiosqlite.Connection):
+    # Убираем дубли, накопленные из-за отсутствия UNIQUE, оставляя первую запись
+    cursor = await db.execute("""
+        DELETE FROM posts
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM posts GROUP BY channel_username, message_id
+        )
+    """)
+    logger.info(f"Удалено дублей постов: {cursor.rowcount}.")
+
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_channel_message
+        ON posts (channel_username, message_id)
+    """)
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_is_active ON users (is_active)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users (is_admin)"
+    )
+
+
+async def _posts_channel_fk(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE channels ADD COLUMN tg_id INTEGER")
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_channels_tg_id ON channels (tg_id)"
+    )
+
+    # SQLite не умеет менять колонки, поэтому пересобираем posts, сохраняя id
+    await db.execute("""
+        CREATE TABLE posts_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL REFERENCES channels (id) ON DELETE CASCADE,
+            message_id INTEGER NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor = await db.execute("""
+        INSERT INTO posts_new (id, channel_id, message_id, added_at)
+        SELECT p.id, c.id, p.message_id, p.added_at
+        FROM posts p
+        JOIN channels c ON c.username = p.channel_username
+    """)
+    logger.info(f"Перенесено постов: {cursor.rowcount}.")
+
+    await db.execute("DROP TABLE posts")
+    await db.execute("ALTER TABLE posts_new RENAME TO posts")
+    await db.execute("""
+        CREATE UNIQUE INDEX idx_posts_channel_message
+        ON posts (channel_id, message_id)
+    """)
+
+
+async def _broadcasts_log(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_username TEXT,
+            message_id INTEGER,
+            total INTEGER NOT NULL,
+            sent INTEGER NOT NULL,
+            blocked INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            retries INTEGER NOT NULL,
+            flood_waits INTEGER NOT NULL,
+            flood_wait_seconds REAL NOT NULL,
+            duration REAL NOT NULL,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+async def _media_cache(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS media_cache (
+            channel_username TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            caption TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel_username, message_id)
+        )
+    """)
+
+
+async def _channel_protection(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE channels ADD COLUMN noforwards INTEGER DEFAULT 0")
+    await db.execute("ALTER TABLE channels ADD COLUMN protection_checked_at TIMESTAMP")
+    await db.execute("ALTER TABLE channels ADD COLUMN copy_failures INTEGER DEFAULT 0")
+    await db.execute("ALTER TABLE channels ADD COLUMN copy_skipped INTEGER DEFAULT 0")
+
+
+async def _backfill_jobs(db: aiosqlite.Connection):
+    # Одна запись на канал: статус и прогресс его полного парсинга
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_jobs (
+            channel_id INTEGER PRIMARY KEY REFERENCES channels (id) ON DELETE CASCADE,
+            status TEXT NOT NULL,
+            target_id INTEGER DEFAULT 0,
+            scanned INTEGER DEFAULT 0,
+            added INTEGER DEFAULT 0,
+            error TEXT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+async def _channel_access_hash(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE channels ADD COLUMN access_hash INTEGER")
+
+
+async def _posts_media_meta(db: aiosqlite.Connection):
+    for column in (
+        "media_type INTEGER",
+        "file_size INTEGER",
+        "duration INTEGER",
+        "width INTEGER",
+        "height INTEGER",
+        "grouped_id INTEGER",
+        "caption_len INTEGER",
+        "views INTEGER",
+        "forwards INTEGER",
+    ):
+        await db.execute(f"ALTER TABLE posts ADD COLUMN {column}")
+
+
+async def _posts_album_ids(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE posts ADD COLUMN album_ids TEXT")
+
+
+async def _posts_phash(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE posts ADD COLUMN phash INTEGER")
+
+
+async def _posts_reactions(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE posts ADD COLUMN reactions INTEGER")
+
+
+async def _settings(db: aiosqlite.Connection):
+    # Настройки, которые админы меняют командами без перезапуска
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
+async def _broadcasts_timing(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN prepare_duration REAL")
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN staged INTEGER DEFAULT 0")
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN first_delivery REAL")
+
+
+async def _broadcasts_rates(db: aiosqlite.Connection):
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN api_calls INTEGER")
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN peak_rate REAL")
+
+
+async def _media_cache_channel_fk(db: aiosqlite.Connection):
+    # Как у posts: ключ по id канала, строки уходят каскадом вместе с каналом
+    await db.execute("""
+        CREATE TABLE media_cache_new (
+            channel_id INTEGER NOT NULL REFERENCES channels (id) ON DELETE CASCADE,
+            message_id INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            caption TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel_id, message_id)
+        )
+    """)
+    # Записи удалённых и неподтверждённых каналов теряются на JOIN
+    cursor = await db.execute("""
+        INSERT INTO media_cache_new
+            (channel_id, message_id, file_id, media_type, caption, added_at)
+        SELECT c.id, m.message_id, m.file_id, m.media_type, m.caption, m.added_at
+        FROM media_cache m
+        JOIN channels c ON c.username = m.channel_username
+    """)
+    logger.info(f"Перенесено file_id: {cursor.rowcount}.")
+
+    await db.execute("DROP TABLE media_cache")
+    await db.execute("ALTER TABLE media_cache_new RENAME TO media_cache")
+
+
+# Порядок важен: номер миграции = индекс в списке + 1 (PRAGMA user_version)
+MIGRATIONS = [
+    _initial_schema,
+    _unique_posts_and_indexes,
+    _posts_channel_fk,
+    _broadcasts_log,
+    _media_cache,
+    _channel_protection,
+    _backfill_jobs,
+    _channel_access_hash,
+    _posts_media_meta,
+    _posts_album_ids,
+    _posts_phash,
+    _posts_reactions,
+    _settings,
+    _broadcasts_timing,
+    _broadcasts_rates,
+    _media_cache_channel_fk,
+]
+
+
+async def run_migrations(db: aiosqlite.Connection):
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    current = row[0] if row else 0
+
+    if current >= len(MIGRATIONS):
+        logger.info(f"Схема БД актуальна (версия {current}).")
+        return
+
+    for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+        logger.info(f"Применение миграции {version}: {migration.__name__}.")
+        try:
+            await db.execute("BEGIN")
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.error(f"Ошибка при применении миграции {version}.", exc_info=True)
+            raise
@@ -14,20 +14,25 @@ from aiogram.types import CallbackQuery, FSInputFile, Message
 from src.config_loader import config
 from src.database import core as db
 from src.keyboards import keyboards
-from src.services import parser
+from src.middlewares.auth import AdminMiddleware
+from src.services import (
+    backfill,
+    dedup,
+    downloads,
+    live,
+    parser,
+    ranking,
+    roles,
+    sender,
+    sweeper,
+)
 from src.states import AddChannelState
 
 logger = logging.getLogger(__name__)
 
 router = Router()
-
-
-async def admin_check(user_id: int):
-    logger.debug(f"Проверка на админа юзера {user_id}.")
-    is_admin = await db.is_admin(user_id)
-    if not is_admin and user_id != int(config.SUPER_ADMIN_ID):
-        return False
-    return True
+router.message.middleware(AdminMiddleware())
+router.callback_query.middleware(AdminMiddleware())
 
 
 async def get_user_info(bot: Bot, user_id: int):
@@ -44,8 +49,59 @@ async def get_user_info(bot: Bot, user_id: int):
         return f"Ошибка: {e}", None
 
 
+async def answer_media(message: Message, media, media_type: str, caption: str | None):
+    caption, parse_mode = sender.fit_caption(caption)
+    if media_type == "video":
+        return await message.answer_video(
+            video=media, caption=caption, parse_mode=parse_mode
+        )
+    elif media_type == "photo":
+        return await message.answer_photo(
+            photo=media, caption=caption, parse_mode=parse_mode
+        )
+
+
+async def send_preview_media(
+    message: Message, username: str, msg_id: int, pending_cache: list
+):
+    """pending_cache копит file_id, которые некуда записать: канал ещё не добавлен."""
+    cached = await db.get_media_cache(username, msg_id)
+    if cached:
+        file_id, media_type, caption = cached
+        try:
+            await answer_media(message, file_id, media_type, caption)
+            return True
+        except TelegramBadRequest as e:
+            logger.warning(
+                f"file_id поста {msg_id} канала {username} недействителен: {e}"
+            )
+            await db.delete_media_cache(username, msg_id)
+
+    file_path, caption, media_type = await parser.download_media_from_post(
+        username, msg_id
+    )
+    if not file_path:
+        return False
+
+    try:
+        sent_msg = await answer_media(
+            message, FSInputFile(file_path), media_type, caption
+        )
+        file_id = sender.get_file_id(sent_msg)
+        if file_id and not await db.set_media_cache(
+            username, msg_id, file_id, media_type, caption
+        ):
+            pending_cache.append([msg_id, file_id, media_type, caption])
+    except Exception as e:
+        await message.answer(f"Не удалось загрузить файл: {e}")
+        logger.error(f"Ошибка при загрузке файла {file_path}: {e}", exc_info=True)
+    finally:
+        downloads.release(file_path)
+    return True
+
+
 @router.message(Command("admin_help"))
-async def cmd_admin_help(message: Message):
+async def cmd_admin_help(message: Message, is_admin: bool):
     logger.debug("Вывод админских команд.")
 
     if not message.from_user:
@@ -54,7 +110,7 @@ async def cmd_admin_help(message: Message):
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     await message.answer(
@@ -64,19 +120,25 @@ async def cmd_admin_help(message: Message):
         "3. /add_channel [username] - добавить канал в базу\n"
         "4. /remove_channel [username] - удалить канал\n"
         "5. /stats - показать полную статистику\n"
-        "6. /logs - отправить файлы с логами"
+        "6. /logs - отправить файлы с логами\n"
+        "7. /backfill [username] - перезапустить полный парсинг канала\n"
+        "8. /backfills - прогресс полных парсингов\n"
+        "9. /backfill_meta - собрать метаданные старых постов\n"
+        "10. /ranking [0-100] - доля рассылок, выбранных по охватам"
     )
 
 
 @router.message(Command("add_admin"))
-async def cmd_add_admin(message: Message, command: CommandObject, bot: Bot):
+async def cmd_add_admin(
+    message: Message, command: CommandObject, bot: Bot, is_admin: bool
+):
     if not message.from_user:
         logger.warning(
             f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     if not command.args:
@@ -89,13 +151,12 @@ async def cmd_add_admin(message: Message, command: CommandObject, bot: Bot):
 
     new_admin_id = int(command.args)
 
-    is_admin = await db.is_admin(new_admin_id)
-    if is_admin:
+    if await roles.is_admin(new_admin_id):
         await message.answer("Пользователь уже является администратором.")
         return
 
     await db.add_user(new_admin_id)
-    await db.add_admin(new_admin_id)
+    await roles.add_admin(new_admin_id)
 
     await message.answer(f"Пользователь {new_admin_id} назначен администратором.")
 
@@ -117,14 +178,16 @@ async def cmd_add_admin(message: Message, command: CommandObject, bot: Bot):
 
 
 @router.message(Command("remove_admin"))
-async def cmd_remove_admin(message: Message, command: CommandObject, bot: Bot):
+async def cmd_remove_admin(
+    message: Message, command: CommandObject, bot: Bot, is_admin: bool
+):
     if not message.from_user:
         logger.warning(
             f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     if not command.args:
@@ -138,8 +201,7 @@ async def cmd_remove_admin(message: Message, command: CommandObject, bot: Bot):
         return
 
     target_id = int(command.args)
-    is_admin = await db.is_admin(target_id)
-    if not is_admin:
+    if not await roles.is_admin(target_id):
         await message.answer("Пользователь не является администратором.")
         return
 
@@ -150,7 +212,7 @@ async def cmd_remove_admin(message: Message, command: CommandObject, bot: Bot):
         )
         return
 
-    await db.remove_admin(target_id)
+    await roles.remove_admin(target_id)
 
     await message.answer(f"Права администратора у пользователя {target_id} отозваны.")
 
@@ -167,7 +229,11 @@ async def cmd_remove_admin(message: Message, command: CommandObject, bot: Bot):
 
 @router.message(Command("add_channel"))
 async def cmd_add_channel(
-    message: Message, command: CommandObject, state: FSMContext, bot: Bot
+    message: Message,
+    command: CommandObject,
+    state: FSMContext,
+    bot: Bot,
+    is_admin: bool,
 ):
     if not message.from_user:
         logger.warning(
@@ -175,7 +241,7 @@ async def cmd_add_channel(
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     if not command.args:
@@ -192,6 +258,7 @@ async def cmd_add_channel(
         preview_ids,
         title,
         channel_int_id,
+        noforwards,
     ) = await parser.check_channel_and_get_preview(raw_username)
 
     if not success:
@@ -205,45 +272,32 @@ async def cmd_add_channel(
 
     await message.answer("Предпросмотр (последние 5 постов):")
 
+    # file_id загруженных превью пишутся в media_cache после подтверждения,
+    # чтобы рассылка не загружала те же файлы второй раз
+    pending_cache: list = []
     for msg_id in reversed(preview_ids):
-        try:
-            await bot.copy_message(
-                chat_id=message.chat.id, from_chat_id=target_chat_id, message_id=msg_id
-            )
-        except Exception:
-            logger.warning(
-                f"Не вышло скопировать сообщение {msg_id} с канала {raw_username} ({target_chat_id})."
-            )
+        copied = False
+        # Из защищённого канала copy_message заведомо не сработает
+        if not noforwards:
+            try:
+                await bot.copy_message(
+                    chat_id=message.chat.id,
+                    from_chat_id=target_chat_id,
+                    message_id=msg_id,
+                )
+                copied = True
+            except Exception:
+                logger.warning(
+                    f"Не вышло скопировать сообщение {msg_id} с канала {raw_username} ({target_chat_id})."
+                )
 
-            file_path, caption, media_type = await parser.download_media_from_post(
-                raw_username, msg_id
+        if not copied and not await send_preview_media(
+            message, raw_username, msg_id, pending_cache
+        ):
+            await message.answer(
+                f"<a href='https://t.me/{raw_username}/{msg_id}'>Пост #{msg_id}</a> (Бот не смог скопировать)",
+                parse_mode="HTML",
             )
-
-            if file_path:
-                try:
-                    video_file = FSInputFile(file_path)
-                    if media_type == "video":
-                        await message.answer_video(
-                            video=video_file, caption=caption, parse_mode="Markdown"
-                        )
-                    elif media_type == "photo":
-                        await message.answer_photo(
-                            photo=video_file, caption=caption, parse_mode="Markdown"
-                        )
-                except Exception as e:
-                    await message.answer(f"Не удалось загрузить файл: {e}")
-                    logger.error(
-                        f"Ошибка при загрузке файла {file_path}: {e}", exc_info=True
-                    )
-                finally:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logger.info(f"Удаление файла {file_path}.")
-            else:
-                await message.answer(
-                    f"<a href='https://t.me/{raw_username}/{msg_id}'>Пост #{msg_id}</a> (Бот не смог скопировать)",
-                    parse_mode="HTML",
-                )
         await asyncio.sleep(1)
 
     await message.answer(
@@ -251,7 +305,12 @@ async def cmd_add_channel(
         reply_markup=keyboards.get_confirm_kb(),
     )
 
-    await state.update_data(username=raw_username)
+    await state.update_data(
+        username=raw_username,
+        tg_id=channel_int_id,
+        noforwards=noforwards,
+        media_cache=pending_cache,
+    )
     await state.set_state(AddChannelState.waiting_for_confirmation)
 
 
@@ -279,12 +338,22 @@ async def process_confirm(callback: CallbackQuery, state: FSMContext):
     success = await db.get_channel(username)
 
     if not success:
-        await db.add_channel(username, callback.from_user.id)
+        await db.add_channel(
+            username,
+            callback.from_user.id,
+            data.get("tg_id"),
+            bool(data.get("noforwards")),
+        )
+        for msg_id, file_id, media_type, caption in data.get("media_cache") or []:
+            await db.set_media_cache(username, msg_id, file_id, media_type, caption)
         await callback.message.edit_text(
             f"Канал @{username} успешно добавлен! "
             "Запускаю фоновый парсинг всех постов... Это займет время."
         )
-        asyncio.create_task(parser.full_parse(username))
+        backfill.start(username)
+        tg_id = data.get("tg_id")
+        if tg_id:
+            await live.watch_channel(tg_id, username)
     else:
         await callback.message.edit_text(f"Канал @{username} уже был в базе.")
 
@@ -316,7 +385,7 @@ async def process_cancel(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("req_del:"))
-async def process_delete_request(callback: CallbackQuery, bot: Bot):
+async def process_delete_request(callback: CallbackQuery, bot: Bot, is_admin: bool):
     if not isinstance(callback.message, Message):
         reason = (
             "InaccessibleMessage (Удалено?)"
@@ -346,12 +415,11 @@ async def process_delete_request(callback: CallbackQuery, bot: Bot):
         await callback.answer("Ошибка данных кнопки.", show_alert=True)
         return
 
-    is_admin = await db.is_admin(callback.from_user.id)
-
-    if is_admin or callback.from_user.id == int(config.SUPER_ADMIN_ID):
+    if is_admin:
         deleted = await db.delete_post(channel_username, msg_id)
         await callback.message.edit_reply_markup(reply_markup=None)
         if deleted:
+            dedup.forget(deleted)
             await callback.answer("Пост удалён вами.", show_alert=True)
             logger.info(
                 f"Админ {callback.from_user.id} удалил пост {msg_id} канала {channel_username}"
@@ -360,7 +428,7 @@ async def process_delete_request(callback: CallbackQuery, bot: Bot):
             await callback.answer("Пост уже был удалён ранее.", show_alert=True)
         return
 
-    admins = await db.get_admins()
+    admins = await roles.get_admins()
     if not admins:
         await callback.answer(
             "Админы не найдены, некому жаловаться :(", show_alert=True
@@ -397,7 +465,7 @@ async def process_delete_request(callback: CallbackQuery, bot: Bot):
 
 
 @router.callback_query(F.data.startswith("mod_dec:"))
-async def process_admin_decision(callback: CallbackQuery):
+async def process_admin_decision(callback: CallbackQuery, is_admin: bool):
     if not isinstance(callback.message, Message):
         reason = (
             "InaccessibleMessage (Удалено?)"
@@ -420,6 +488,10 @@ async def process_admin_decision(callback: CallbackQuery):
         await callback.answer("Ошибка кнопки (нет данных).")
         return
 
+    if not is_admin:
+        await callback.answer("Недостаточно прав.", show_alert=True)
+        return
+
     try:
         parts = callback.data.split(":")
         decision = parts[1]
@@ -433,9 +505,10 @@ async def process_admin_decision(callback: CallbackQuery):
     if decision == "no":
         await callback.answer("Оставлено.", show_alert=True)
     elif decision == "yes":
-        is_deleted = await db.delete_post(channel_username, msg_id)
+        deleted = await db.delete_post(channel_username, msg_id)
 
-        if is_deleted:
+        if deleted:
+            dedup.forget(deleted)
             await callback.answer("Удалено.", show_alert=True)
         else:
             await callback.answer(
@@ -444,14 +517,14 @@ async def process_admin_decision(callback: CallbackQuery):
 
 
 @router.message(Command("remove_channel"))
-async def cmd_remove_channel(message: Message, command: CommandObject):
+async def cmd_remove_channel(message: Message, command: CommandObject, is_admin: bool):
     if not message.from_user:
         logger.warning(
             f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     if not command.args:
@@ -462,23 +535,29 @@ async def cmd_remove_channel(message: Message, command: CommandObject):
 
     username = command.args.strip().split("/")[-1].replace("@", "")
 
-    is_deleted = await db.remove_channel(username, message.from_user.id)
+    channel = await db.get_channel(username)
+    # Иначе бэкфилл продолжит качать историю и писать в удалённый канал
+    await backfill.cancel(username)
+    removed = await db.remove_channel(username, message.from_user.id)
 
-    if is_deleted:
+    if removed is not None:
+        dedup.forget(removed)
+        if channel and channel[1]:
+            live.unwatch_channel(channel[1])
         await message.answer(f"Канал @{username} и все его посты удалены из базы.")
     else:
         await message.answer(f"Канал @{username} не найден в базе.")
 
 
 @router.message(Command("stats"))
-async def cmd_stats(message: Message, bot: Bot):
+async def cmd_stats(message: Message, bot: Bot, is_admin: bool):
     if not message.from_user:
         logger.warning(
             f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     await message.answer("Начинаю сбор статистики...")
@@ -488,7 +567,7 @@ async def cmd_stats(message: Message, bot: Bot):
     inactive_users = users_stat["inactive"]
     total_users = active_users + inactive_users
 
-    admins_list = await db.get_admins()
+    admins_list = await roles.get_admins()
 
     channels_data = await db.get_channels_stats()
 
@@ -501,6 +580,26 @@ async def cmd_stats(message: Message, bot: Bot):
         f"• Мёртвых: {inactive_users}\n"
     )
 
+    if sender.current_stats:
+        text += f"\nИдёт рассылка: {sender.current_stats}\n"
+
+    broadcasts = await db.get_broadcasts_stats()
+    if broadcasts and broadcasts["count"]:
+        text += (
+            f"\nРассылки за сутки ({broadcasts['count']}):\n"
+            f"• Доставлено: {broadcasts['sent']}\n"
+            f"• Заблокировали бота: {broadcasts['blocked']}\n"
+            f"• Ошибок: {broadcasts['failed']}\n"
+            f"• Flood wait: {broadcasts['flood_waits']} раз, "
+            f"{broadcasts['flood_wait_seconds']:.0f} из {broadcasts['duration']:.0f} с\n"
+            f"• Подготовлено заранее: {broadcasts['staged']}, "
+            f"подготовка в среднем {broadcasts['avg_prepare'] or 0:.1f} с\n"
+            f"• Первая доставка от начала слота: "
+            f"{broadcasts['avg_first_delivery'] or 0:.2f} с в среднем\n"
+            f"• Темп: пик {broadcasts['peak_rate'] or 0:.0f} сообщ/с, "
+            f"в среднем {broadcasts['avg_rate'] or 0:.2f} сообщ/с\n"
+        )
+
     await message.answer(text)
 
     text = f"Администраторы ({len(admins_list)}):\n"
@@ -518,13 +617,58 @@ async def cmd_stats(message: Message, bot: Bot):
     else:
         text += "• База администраторов пуста"
 
+    text += (
+        f"\nКэш ролей: {roles.stats['hits']} попаданий, "
+        f"{roles.stats['misses']} промахов"
+    )
+
     await message.answer(text)
 
     text = f"Каналы ({len(channels_data)}):\n"
+    if parser.last_report:
+        text += f"Последний парсинг: {parser.last_report}\n"
+    text += (
+        f"Резолв каналов: из кэша {parser.peer_stats['cached']}, "
+        f"запросов {parser.peer_stats['resolved']}\n"
+    )
+    if sweeper.current_report:
+        text += f"Проверка живости идёт: {sweeper.current_report}\n"
+    if sweeper.last_report:
+        text += f"Последняя проверка живости: {sweeper.last_report}\n"
+    mb = 1024 * 1024
+    text += (
+        f"Кэш загрузок: {downloads.used / mb:.0f}/{config.DOWNLOAD_CACHE_MB} МБ, "
+        f"попаданий {downloads.stats['hits']}, промахов {downloads.stats['misses']}, "
+        f"сэкономлено {downloads.stats['bytes_saved'] / mb:.0f} МБ, "
+        f"вытеснено {downloads.stats['evicted']}\n"
+    )
+    if config.DEDUP:
+        text += (
+            f"Дубли: проверено {dedup.stats['checked']}, "
+            f"пропущено {dedup.stats['duplicates']}\n"
+        )
+    if config.LIVE_INGEST:
+        text += (
+            f"Живой приём: получено {live.stats['received']}, "
+            f"добавлено {live.stats['added']}\n"
+        )
 
     if channels_data:
-        for username, post_count in channels_data:
-            text += f"• @{username}: {post_count} постов\n"
+        for (
+            username,
+            post_count,
+            noforwards,
+            copy_failures,
+            copy_skipped,
+        ) in channels_data:
+            text += f"• @{username}: {post_count} постов"
+            if noforwards:
+                text += " (защищён от копирования)"
+            if copy_failures or copy_skipped:
+                text += (
+                    f", copy_message: ошибок {copy_failures}, пропущено {copy_skipped}"
+                )
+            text += "\n"
     else:
         text += "• База каналов пуста"
 
@@ -532,14 +676,14 @@ async def cmd_stats(message: Message, bot: Bot):
 
 
 @router.message(Command("logs"))
-async def cmd_logs(message: Message):
+async def cmd_logs(message: Message, is_admin: bool):
     if not message.from_user:
         logger.warning(
             f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
         )
         return
 
-    if not await admin_check(message.from_user.id):
+    if not is_admin:
         return
 
     log_dir = "logs"
@@ -573,3 +717,109 @@ async def cmd_logs(message: Message):
     finally:
         if os.path.exists(archive_path):
             os.remove(archive_path)
+
+
+@router.message(Command("backfill"))
+async def cmd_backfill(message: Message, command: CommandObject, is_admin: bool):
+    if not message.from_user:
+        logger.warning(
+            f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
+        )
+        return
+
+    if not is_admin:
+        return
+
+    if not command.args:
+        await message.answer("/backfill [username]\n\nНапример: /backfill super_memes")
+        return
+
+    username = command.args.strip().split("/")[-1].replace("@", "")
+
+    if not await db.get_channel(username):
+        await message.answer(f"Канал @{username} не найден в базе.")
+        return
+
+    if not backfill.start(username):
+        await message.answer(f"Полный парсинг @{username} уже идёт.")
+        return
+
+    await message.answer(
+        f"Полный парсинг @{username} запущен с последнего сохранённого поста."
+    )
+
+
+@router.message(Command("backfills"))
+async def cmd_backfills(message: Message, is_admin: bool):
+    if not message.from_user:
+        logger.warning(
+            f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
+        )
+        return
+
+    if not is_admin:
+        return
+
+    jobs = await db.get_backfill_jobs()
+    if not jobs:
+        await message.answer("Полных парсингов ещё не было.")
+        return
+
+    text = "Полные парсинги:\n"
+    for username, status, offset, target_id, scanned, added, error, updated_at in jobs:
+        progress = f"{min(offset / target_id, 1):.0%}" if target_id else "?"
+        text += (
+            f"• @{username}: {status}, {progress} (пост {offset}/{target_id}), "
+            f"просмотрено {scanned}, добавлено {added}, обновлён {updated_at}\n"
+        )
+        if error:
+            text += f"  Ошибка: {error}\n"
+
+    await message.answer(text)
+
+
+@router.message(Command("backfill_meta"))
+async def cmd_backfill_meta(message: Message, is_admin: bool):
+    if not message.from_user:
+        logger.warning(
+            f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
+        )
+        return
+
+    if not is_admin:
+        return
+
+    await message.answer("Собираю метаданные постов. Это может занять время.")
+    updated = await parser.backfill_post_meta()
+    await message.answer(f"Метаданные обновлены для {updated} постов.")
+
+
+@router.message(Command("ranking"))
+async def cmd_ranking(message: Message, command: CommandObject, is_admin: bool):
+    if not message.from_user:
+        logger.warning(
+            f"Получено сообщение без user_id: chat_id = {message.chat.id}, message_id = {message.message_id}"
+        )
+        return
+
+    if not is_admin:
+        return
+
+    if not command.args:
+        blend = await ranking.get_blend()
+        await message.answer(
+            f"По охватам выбирается {blend}% рассылок, остальные — случайно.\n\n"
+            "/ranking [0-100]\n\nНапример: /ranking 50"
+        )
+        return
+
+    if not command.args.isdigit() or int(command.args) > 100:
+        await message.answer("Укажите число от 0 до 100.")
+        return
+
+    blend = int(command.args)
+    if await ranking.set_blend(blend):
+        logger.info(f"Админ {message.from_user.id} изменил долю рейтинга на {blend}%.")
+        await message.answer(f"Теперь по охватам выбирается {blend}% рассылок.")
+    else:
+        await message.answer("Не удалось сохранить настройку.")
@@ -5,7 +5,7 @@ from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.types import Message
 
 from src.database import core as db
-from src.services import sender
+from src.services import roles, sender
 
 logger = logging.getLogger(__name__)
 
@@ -78,7 +78,7 @@ async def cmd_support(message: Message, command: CommandObject, bot: Bot):
         f"{command.args}"
     )
 
-    admins = await db.get_admins()
+    admins = await roles.get_admins()
     if not admins:
         await message.answer("Админы не найдены, некому жаловаться :(", show_alert=True)
         return
@@ -25,6 +25,24 @@ def get_delete_post_kb(channel_username: str, msg_id: int):
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
+def get_post_kb(channel_username: str, msg_id: int):
+    kb = [
+        [
+            InlineKeyboardButton(
+                text=f"Источник @{channel_username}",
+                url=f"https://t.me/{channel_username}/{msg_id}",
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="Удалить из БД (ЧС)",
+                callback_data=f"req_del:{channel_username}:{msg_id}",
+            )
+        ],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
 def get_delete_post_admin_kb(channel_username: str, msg_id: int):
     kb = [
         [
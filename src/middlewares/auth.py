@@ -0,0 +1,23 @@
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from src.services import roles
+
+logger = logging.getLogger(__name__)
+
+
+class AdminMiddleware(BaseMiddleware):
+    """Кладёт в данные хендлера is_admin (с учётом super admin) из кэша ролей."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        data["is_admin"] = user is not None and await roles.has_admin_rights(user.id)
+        return await handler(event, data)
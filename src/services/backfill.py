@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+import logging
+
+from src.database import core as db
+from src.services import parser
+
+logger = logging.getLogger(__name__)
+
+# username -> задача полного парсинга; не больше одной на канал
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def is_running(username: str):
+    task = _tasks.get(username)
+    return task is not None and not task.done()
+
+
+async def _run(username: str):
+    try:
+        target_id = await parser.get_last_message_id(username)
+    except Exception as e:
+        logger.error(
+            f"Не удалось получить последний пост канала {username}: {e}", exc_info=True
+        )
+        target_id = 0
+
+    if not await db.start_backfill_job(username, target_id):
+        return
+    offset = await db.get_channel_offset(username) or 0
+
+    async def on_chunk(last_id: int, scanned: int, added: int):
+        await db.update_backfill_job(username, scanned, added)
+
+    try:
+        await parser.full_parse(username, offset, on_chunk)
+    except asyncio.CancelledError:
+        # Остановка бота: статус остаётся running, продолжим при следующем запуске.
+        # У удалённого канала запись бэкфилла уходит каскадом вместе с ним
+        logger.info(f"Бэкфилл канала {username} остановлен.")
+        raise
+    except Exception as e:
+        logger.error(f"Бэкфилл канала {username} упал: {e}", exc_info=True)
+        await db.finish_backfill_job(username, "failed", str(e))
+        return
+
+    await db.finish_backfill_job(username, "done")
+
+
+def start(username: str):
+    if is_running(username):
+        logger.warning(f"Бэкфилл канала {username} уже идёт.")
+        return False
+
+    task = asyncio.create_task(_run(username))
+    _tasks[username] = task
+    # Канал могли удалить и добавить заново: чужую задачу не трогаем
+    task.add_done_callback(
+        lambda done: _tasks.pop(username) if _tasks.get(username) is done else None
+    )
+    return True
+
+
+async def cancel(username: str):
+    """Останавливает бэкфилл канала и ждёт его завершения. False, если он не шёл."""
+    task = _tasks.get(username)
+    if task is None or task.done():
+        return False
+
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+    return True
+
+
+async def resume_all():
+    jobs = await db.get_backfill_jobs("running")
+    if not jobs:
+        return
+
+    logger.info(f"Возобновление {len(jobs)} незавершённых бэкфиллов.")
+    for username, *_ in jobs:
+        start(username)
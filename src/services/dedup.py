@@ -0,0 +1,134 @@
+import io
+import logging
+
+from PIL import Image
+from telethon.tl.types import Message, PhotoStrippedSize
+from telethon.utils import stripped_photo_to_jpg
+
+from src.config_loader import config
+from src.database import core as db
+from src.services.hamming import HASH_BITS, HammingIndex
+
+logger = logging.getLogger(__name__)
+
+# dHash: 8x8 сравнений соседних пикселей уменьшенной серой картинки
+HASH_SIZE = 8
+
+_index = HammingIndex(config.DEDUP_DISTANCE)
+
+stats = {"checked": 0, "duplicates": 0}
+
+
+def _stripped_thumb(message: Message):
+    """Миниатюра, которая приходит прямо в сообщении, без отдельного скачивания."""
+    if message.photo:
+        sizes = message.photo.sizes
+    elif message.document:
+        sizes = message.document.thumbs
+    else:
+        return None
+
+    for size in sizes or []:
+        if isinstance(size, PhotoStrippedSize):
+            return size.bytes
+    return None
+
+
+def dhash(image: bytes):
+    with Image.open(io.BytesIO(image)) as img:
+        small = img.convert("L").resize(
+            (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS
+        )
+        pixels = list(small.getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            value = value << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return value
+
+
+def image_hash(message: Message):
+    """Перцептивный хэш медиа поста в виде знакового int64 (для SQLite) или None."""
+    thumb = _stripped_thumb(message)
+    if not thumb:
+        return None
+
+    try:
+        value = dhash(stripped_photo_to_jpg(thumb))
+    except Exception as e:
+        logger.warning(f"Не удалось посчитать хэш поста {message.id}: {e}")
+        return None
+
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+async def _find_original(phash: int):
+    """(username, message_id, расстояние) поста в базе с похожим медиа или None."""
+    while match := _index.find(phash):
+        post_id, distance, value = match
+        original = await db.get_post_by_id(post_id)
+        if original:
+            return original[0], original[1], distance
+        # Пост удалён мимо forget: его хэш больше ничего не защищает
+        _index.remove(value, post_id)
+    return None
+
+
+async def filter_duplicates(channel_username: str, posts: list):
+    """Отбрасывает посты, чьё медиа уже есть в базе или раньше в этой пачке.
+
+    Индекс пополняется только после записи через remember, когда известны id.
+    """
+    if not config.DEDUP:
+        return posts
+
+    batch = HammingIndex(config.DEDUP_DISTANCE)
+    unique = []
+    for post in posts:
+        if post.phash is None:
+            unique.append(post)
+            continue
+
+        stats["checked"] += 1
+        original = await _find_original(post.phash)
+        if original is None and (match := batch.find(post.phash)):
+            original = channel_username, match[0], match[1]
+
+        # Совпадение с самим собой бывает при повторном парсинге
+        if original and original[:2] != (channel_username, post.message_id):
+            original_channel, original_id, distance = original
+            stats["duplicates"] += 1
+            logger.info(
+                f"Пост {post.message_id} канала {channel_username} пропущен: дубль "
+                f"поста {original_id} канала {original_channel} (расстояние {distance})."
+            )
+            continue
+
+        batch.add(post.phash, post.message_id)
+        unique.append(post)
+    return unique
+
+
+def remember(rows: list):
+    """rows: (id, phash) записанных постов."""
+    for post_id, phash in rows:
+        if phash is not None:
+            _index.add(phash, post_id)
+
+
+def forget(rows: list):
+    """rows: (id, phash) удалённых постов."""
+    for post_id, phash in rows:
+        if phash is not None:
+            _index.remove(phash, post_id)
+
+
+async def load():
+    if not config.DEDUP:
+        return
+
+    rows = await db.get_post_hashes() or []
+    remember(rows)
+    logger.info(f"Индекс дублей загружен: {len(_index)} хэшей.")
@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+
+from telethon.tl.types import Message
+
+from src.config_loader import config
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADS_DIR = "downloads"
+# Недокачанные файлы живут отдельно и в кэш попадают только целиком
+TMP_DIR = os.path.join(DOWNLOADS_DIR, "tmp")
+# p<id фото> или d<id документа> с расширением
+_KEY_RE = re.compile(r"[pd]-?\d+(\.\w+)?")
+
+# Ключ -> размер файла, от давно не использованных к свежим
+_entries: OrderedDict[str, int] = OrderedDict()
+# Ключ -> число отправок, которые сейчас читают файл (такие не вытесняются)
+_pins: dict[str, int] = {}
+# Занято кэшем на диске, байт
+used = 0
+
+stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "evicted": 0}
+
+
+def media_key(message: Message):
+    """Ключ по id медиа в Telegram: репосты одного файла делят одну запись."""
+    if message.photo:
+        return f"p{message.photo.id}.jpg"
+    if message.document:
+        return f"d{message.document.id}{message.file.ext or ''}"
+    return None
+
+
+def _path(key: str):
+    return os.path.join(DOWNLOADS_DIR, key)
+
+
+def _budget():
+    return config.DOWNLOAD_CACHE_MB * 1024 * 1024
+
+
+def _pin(key: str):
+    _pins[key] = _pins.get(key, 0) + 1
+
+
+def _evict():
+    global used
+
+    for key in list(_entries):
+        if used <= _budget():
+            break
+        if key in _pins:
+            continue
+
+        used -= _entries.pop(key)
+        stats["evicted"] += 1
+        try:
+            os.remove(_path(key))
+        except FileNotFoundError:
+            pass
+        logger.info(f"Файл {key} вытеснен из кэша загрузок.")
+
+
+def acquire(key: str):
+    """Путь к закэшированному файлу или None. Найденный файл нужно отдать в release."""
+    global used
+
+    size = _entries.get(key)
+    if size is not None and not os.path.exists(_path(key)):
+        del _entries[key]
+        used -= size
+        size = None
+
+    if size is None:
+        stats["misses"] += 1
+        return None
+
+    stats["hits"] += 1
+    stats["bytes_saved"] += size
+    _entries.move_to_end(key)
+    # mtime хранит порядок LRU между перезапусками
+    os.utime(_path(key))
+    _pin(key)
+    return _path(key)
+
+
+def temp_path(key: str):
+    os.makedirs(TMP_DIR, exist_ok=True)
+    # Расширение остаётся в конце имени, telethon его не меняет
+    return os.path.join(TMP_DIR, f"{uuid.uuid4().hex}-{key}")
+
+
+def commit(key: str, temp: str):
+    """Переносит докачанный файл в кэш и возвращает путь, который нужно отдать в release."""
+    global used
+
+    path = _path(key)
+    os.replace(temp, path)
+    size = os.path.getsize(path)
+    used += size - _entries.get(key, 0)
+    _entries[key] = size
+    _entries.move_to_end(key)
+    _pin(key)
+    _evict()
+    return path
+
+
+def release(path: str):
+    key = os.path.basename(path)
+    count = _pins.get(key, 0) - 1
+    if count > 0:
+        _pins[key] = count
+    else:
+        _pins.pop(key, None)
+    _evict()
+
+
+def collect_garbage():
+    """Чистит остатки прошлых запусков и загружает индекс кэша с диска."""
+    global used
+
+    os.makedirs(TMP_DIR, exist_ok=True)
+    removed = 0
+    for name in os.listdir(TMP_DIR):
+        os.remove(os.path.join(TMP_DIR, name))
+        removed += 1
+
+    files = []
+    for name in os.listdir(DOWNLOADS_DIR):
+        path = _path(name)
+        if not os.path.isfile(path):
+            continue
+        # Файлы со старыми именами оставались после падения посреди рассылки
+        if not _KEY_RE.fullmatch(name):
+            os.remove(path)
+            removed += 1
+            continue
+        stat = os.stat(path)
+        files.append((stat.st_mtime, name, stat.st_size))
+
+    _entries.clear()
+    used = 0
+    for _, name, size in sorted(files):
+        _entries[name] = size
+        used += size
+    _evict()
+
+    logger.info(
+        f"Кэш загрузок: {len(_entries)} файлов, {used / 1024 / 1024:.1f} МБ, "
+        f"удалено мусора: {removed}."
+    )
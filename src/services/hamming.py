@@ -0,0 +1,119 @@
+from array import array
+from itertools import accumulate
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# Записи группируются по младшим битам блока (не больше BUCKET_BITS): лишние
+# кандидаты из общей корзины отсеивает проверка расстояния
+BUCKET_BITS = 16
+# Ключ удалённой записи: её место в массивах освобождается только при перезапуске
+_REMOVED = -1
+# Новые записи копятся в словарях и сливаются в массивы, когда их набирается
+# столько или 1/16 от уже слитых: слияние копирует массивы целиком
+MERGE_MIN = 4096
+
+
+class HammingIndex:
+    """Поиск 64-битных хэшей в пределах расстояния Хэмминга (multi-index hashing).
+
+    Хэш режется на max_distance + 1 блоков. Если два хэша отличаются не более
+    чем в max_distance битах, хотя бы один блок у них совпадает целиком, поэтому
+    кандидатов достаточно искать точным совпадением по каждому блоку.
+
+    Записи лежат в плоских массивах: на 1M хэшей при max_distance=4 это около
+    40 МБ вместо ~150 МБ словарей со списками int. Ключи — неотрицательные int.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        width, extra = divmod(HASH_BITS, blocks)
+
+        # (сдвиг, маска корзины) каждого блока
+        self._blocks: list[tuple[int, int]] = []
+        shift = 0
+        for i in range(blocks):
+            block_width = width + (1 if i < extra else 0)
+            self._blocks.append((shift, (1 << min(block_width, BUCKET_BITS)) - 1))
+            shift += block_width
+
+        # Хэш и ключ записи по её номеру
+        self._values = array("Q")
+        self._keys = array("q")
+        self._size = 0
+        # По каждому блоку номера слитых записей, сгруппированные по корзинам:
+        # записи корзины b лежат в slots[offsets[b]:offsets[b + 1]]
+        self._slots = [array("I") for _ in self._blocks]
+        self._offsets = [array("I", bytes(4 * (mask + 2))) for _, mask in self._blocks]
+        # Записи с номера _merged ещё не слиты: корзина -> номера записей
+        self._merged = 0
+        self._recent: list[dict[int, list[int]]] = [{} for _ in self._blocks]
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value: int, key: int):
+        value &= HASH_MASK
+        slot = len(self._values)
+        self._values.append(value)
+        self._keys.append(key)
+        self._size += 1
+        for recent, (shift, mask) in zip(self._recent, self._blocks):
+            recent.setdefault(value >> shift & mask, []).append(slot)
+
+        if len(self._values) - self._merged >= max(MERGE_MIN, self._merged // 16):
+            self._merge()
+
+    def remove(self, value: int, key: int):
+        """Убирает запись с этим хэшем и ключом, если она есть."""
+        value &= HASH_MASK
+        shift, mask = self._blocks[0]
+        for slot in self._candidates(0, value >> shift & mask):
+            if self._values[slot] == value and self._keys[slot] == key:
+                self._keys[slot] = _REMOVED
+                self._size -= 1
+                return
+
+    def find(self, value: int):
+        """Ближайший хэш в пределах max_distance: (ключ, расстояние, хэш) или None."""
+        value &= HASH_MASK
+        values, keys = self._values, self._keys
+        best = None
+        best_distance = self.max_distance + 1
+        for block, (shift, mask) in enumerate(self._blocks):
+            for slot in self._candidates(block, value >> shift & mask):
+                distance = (values[slot] ^ value).bit_count()
+                if distance < best_distance and keys[slot] != _REMOVED:
+                    best, best_distance = slot, distance
+
+        if best is None:
+            return None
+        return self._keys[best], best_distance, self._values[best]
+
+    def _candidates(self, block: int, bucket: int):
+        offsets = self._offsets[block]
+        merged = self._slots[block][offsets[bucket] : offsets[bucket + 1]]
+        recent = self._recent[block].get(bucket)
+        return [*merged, *recent] if recent else merged
+
+    def _merge(self):
+        for block, recent in enumerate(self._recent):
+            offsets, slots = self._offsets[block], self._slots[block]
+            merged = array("I")
+            start = 0
+            for bucket in sorted(recent):
+                end = offsets[bucket + 1]
+                merged.extend(slots[start:end])
+                merged.extend(recent[bucket])
+                start = end
+            merged.extend(slots[start:])
+
+            counts = [
+                offsets[b + 1] - offsets[b] + len(recent.get(b, ()))
+                for b in range(len(offsets) - 1)
+            ]
+            self._offsets[block] = array("I", accumulate(counts, initial=0))
+            self._slots[block] = merged
+            recent.clear()
+        self._merged = len(self._values)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Глобальный лимит: rate запросов в секунду с запасом на всплеск capacity."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов всем ожидающим (flood wait от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    # После паузы разгоняемся с нуля, а не всплеском
+                    self._tokens = 0
+                    self._updated = time.monotonic()
+                    continue
+
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Общий TokenBucket плюс минимальный интервал между запросами в один чат."""
+
+    def __init__(self, bucket: TokenBucket, chat_interval: float):
+        self.bucket = bucket
+        self.chat_interval = chat_interval
+        self._next_allowed: dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        delay = self._next_allowed.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.bucket.acquire()
+        # Интервал считается от фактической отправки: очередь к общему
+        # бакету иначе съедала бы его, и запросы в чат шли бы подряд
+        self._next_allowed[chat_id] = time.monotonic() + self.chat_interval
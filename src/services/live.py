@@ -0,0 +1,132 @@
+import asyncio
+import logging
+
+from telethon import events
+from telethon.tl.functions.channels import JoinChannelRequest
+from telethon.tl.types import PeerChannel
+from telethon.utils import get_peer_id
+
+from src.config_loader import config
+from src.database import core as db
+from src.services import dedup, parser
+
+logger = logging.getLogger(__name__)
+
+LIVE_FLUSH_INTERVAL = 10
+
+# id чата в формате событий telethon (-100...) -> telegram id канала
+_channels: dict[int, int] = {}
+# telegram id канала -> новые посты, ещё не записанные в БД
+_buffer: dict[int, list[parser.PostMeta]] = {}
+_flush_task: asyncio.Task | None = None
+
+stats = {"received": 0, "added": 0}
+
+
+async def watch_channel(tg_id: int, username: str):
+    """Добавляет канал в живой приём, при необходимости вступая в него."""
+    if not config.LIVE_INGEST:
+        return
+
+    _channels[get_peer_id(PeerChannel(tg_id))] = tg_id
+
+    # Обновления приходят только по каналам, где аккаунт парсера состоит
+    try:
+        await parser.ensure_connection()
+        entity = await parser.with_peer(username, parser.client.get_entity)
+        if entity.left:
+            await parser.client(JoinChannelRequest(entity))
+            logger.info(f"Парсер вступил в канал {username} для живого приёма.")
+    except Exception as e:
+        logger.error(
+            f"Не удалось подписаться на обновления канала {username}: {e}",
+            exc_info=True,
+        )
+
+
+def unwatch_channel(tg_id: int):
+    _channels.pop(get_peer_id(PeerChannel(tg_id)), None)
+
+
+async def _on_new_message(event: events.NewMessage.Event):
+    # Части альбома приходят ещё и одним событием Album, там их и склеиваем
+    if event.message.grouped_id:
+        return
+
+    tg_id = _channels.get(event.chat_id)
+    if not tg_id or not parser.is_valid_media(event.message):
+        return
+
+    await _add(tg_id, [parser.post_meta(event.message)])
+
+
+async def _on_album(event: events.Album.Event):
+    tg_id = _channels.get(event.chat_id)
+    if not tg_id:
+        return
+
+    metas = [parser.post_meta(m) for m in event.messages if parser.is_valid_media(m)]
+    if metas:
+        await _add(tg_id, parser.group_albums(metas))
+
+
+async def _add(tg_id: int, posts: list[parser.PostMeta]):
+    stats["received"] += len(posts)
+    buffer = _buffer.setdefault(tg_id, [])
+    buffer.extend(posts)
+    if len(buffer) >= parser.PARSE_CHUNK_SIZE:
+        await flush()
+
+
+async def flush():
+    global _buffer
+
+    buffers, _buffer = _buffer, {}
+    for tg_id, posts in buffers.items():
+        # Username берём из БД в момент записи: канал мог его сменить
+        username = await db.get_channel_username(tg_id)
+        if not username:
+            continue
+
+        posts = await dedup.filter_duplicates(username, posts)
+        if not posts:
+            continue
+
+        # offset не двигаем: пропуски за время простоя закроет daily_parse
+        stored = await db.add_posts(username, posts)
+        if stored is not None:
+            dedup.remember(stored)
+            stats["added"] += len(posts)
+            logger.info(f"Живой приём: {len(posts)} постов канала {username}.")
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(LIVE_FLUSH_INTERVAL)
+        await flush()
+
+
+async def start():
+    global _flush_task
+
+    if not config.LIVE_INGEST:
+        return
+
+    logger.info("Запуск живого приёма постов.")
+    channels = await db.get_all_channels() or []
+    for username, _, tg_id in channels:
+        if tg_id:
+            await watch_channel(tg_id, username)
+
+    parser.client.add_event_handler(_on_new_message, events.NewMessage())
+    parser.client.add_event_handler(_on_album, events.Album())
+    _flush_task = asyncio.create_task(_flush_loop())
+    logger.info(f"Живой приём запущен для {len(_channels)} каналов.")
+
+
+async def stop():
+    if _flush_task:
+        _flush_task.cancel()
+    parser.client.remove_event_handler(_on_new_message)
+    parser.client.remove_event_handler(_on_album)
+    await flush()
@@ -1,18 +1,99 @@
 import asyncio
 import logging
 import os
+import time
+from dataclasses import dataclass, field
+from functools import reduce
+from typing import Awaitable, Callable, NamedTuple
 
 import qrcode
+from telethon.errors import ChannelInvalidError, FloodWaitError, PeerIdInvalidError
 from telethon.sync import TelegramClient
-from telethon.tl.types import Channel, Message
+from telethon.tl.types import Channel, InputPeerChannel, Message, PeerChannel
 
 from src.config_loader import config
 from src.database import core as db
+from src.services import dedup, downloads, ranking
+from src.services.limiter import TokenBucket
+from src.services.streams import fetch_parallel
 
 logger = logging.getLogger(__name__)
 
+PARSE_CHUNK_SIZE = 500
+# iter_messages тянет историю страницами по 100 сообщений за запрос
+PARSE_PAGE_SIZE = 100
+PARSE_RETRY_DELAY = 5.0
+# get_messages(ids=[...]) отдаёт до 100 сообщений за запрос
+META_BATCH_SIZE = 100
+# Максимальный размер части файла в upload.getFile
+DOWNLOAD_PART_SIZE = 512 * 1024
+# Файлы меньше качаются одним потоком: выигрыш не окупает лишние запросы
+PARALLEL_MIN_SIZE = 10 * 1024 * 1024
+
+MEDIA_PHOTO = 1
+MEDIA_VIDEO = 2
+MEDIA_ALBUM = 3
+
+
 client = TelegramClient("parser", config.API_ID, config.API_HASH)
 
+# Общий лимит запросов telethon-клиента для всех параллельных парсингов
+_bucket = TokenBucket(config.PARSE_RATE)
+
+
+@dataclass
+class ParseReport:
+    channels: int = 0
+    failed: int = 0
+    scanned: int = 0
+    added: int = 0
+    duplicates: int = 0
+    flood_waits: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def __str__(self):
+        return (
+            f"каналов {self.channels} (с ошибкой {self.failed}), "
+            f"просмотрено {self.scanned} сообщений, добавлено {self.added} постов, "
+            f"дублей {self.duplicates}, flood wait {self.flood_waits}, {self.elapsed:.1f} с"
+        )
+
+
+class PostMeta(NamedTuple):
+    message_id: int
+    media_type: int
+    file_size: int | None
+    duration: int | None
+    width: int | None
+    height: int | None
+    grouped_id: int | None
+    caption_len: int
+    views: int | None
+    forwards: int | None
+    # id всех сообщений альбома через запятую, None для одиночного поста
+    album_ids: str | None = None
+    # Перцептивный хэш миниатюры (dedup.image_hash), у альбома — первой части
+    phash: int | None = None
+    reactions: int | None = None
+
+
+@dataclass
+class ChannelJob:
+    username: str
+    last_id: int
+    tg_id: int | None
+
+
+# Итоги последнего ежедневного парсинга (для /stats)
+last_report: ParseReport | None = None
+
+# cached: peer собран из БД без запроса, resolved: пришлось резолвить username
+peer_stats = {"cached": 0, "resolved": 0}
+
 
 async def ensure_connection():
     if not client.is_connected():
@@ -40,22 +121,167 @@ def is_valid_media(message: Message):
     return True
 
 
-async def download_media_from_post(username: str, message_id: int):
-    await ensure_connection()
+def count_reactions(message: Message):
+    if not message.reactions:
+        return None
+    return sum(result.count for result in message.reactions.results)
+
 
+def post_meta(message: Message):
+    file = message.file
+    duration = file.duration if message.video else None
+    return PostMeta(
+        message_id=message.id,
+        media_type=MEDIA_VIDEO if message.video else MEDIA_PHOTO,
+        file_size=file.size if file else None,
+        duration=int(duration) if duration is not None else None,
+        width=file.width if file else None,
+        height=file.height if file else None,
+        grouped_id=message.grouped_id,
+        caption_len=len(message.message or ""),
+        views=message.views,
+        forwards=message.forwards,
+        phash=dedup.image_hash(message),
+        reactions=count_reactions(message),
+    )
+
+
+def _sum_or_none(a: int | None, b: int | None):
+    return None if a is None and b is None else (a or 0) + (b or 0)
+
+
+def _max_or_none(a: int | None, b: int | None):
+    return None if a is None and b is None else max(a or 0, b or 0)
+
+
+def group_albums(posts: list[PostMeta]):
+    """Склеивает подряд идущие части альбома (общий grouped_id) в один пост."""
+    grouped: list[PostMeta] = []
+    for post in posts:
+        last = grouped[-1] if grouped else None
+        if not (post.grouped_id and last and last.grouped_id == post.grouped_id):
+            grouped.append(post)
+            continue
+
+        grouped[-1] = last._replace(
+            media_type=MEDIA_ALBUM,
+            album_ids=f"{last.album_ids or last.message_id},{post.message_id}",
+            file_size=_sum_or_none(last.file_size, post.file_size),
+            duration=_sum_or_none(last.duration, post.duration),
+            caption_len=max(last.caption_len, post.caption_len),
+            views=_max_or_none(last.views, post.views),
+            forwards=_max_or_none(last.forwards, post.forwards),
+            reactions=_max_or_none(last.reactions, post.reactions),
+        )
+    return grouped
+
+
+def continues_album(buffer: list[PostMeta], message: Message):
+    return bool(
+        message.grouped_id and buffer and buffer[-1].grouped_id == message.grouped_id
+    )
+
+
+async def get_input_peer(username: str, refresh: bool = False):
+    """InputPeerChannel из сохранённых id и access hash, резолв username только при промахе."""
+    if not refresh:
+        peer = await db.get_channel_peer(username)
+        if peer and peer[0] and peer[1] is not None:
+            peer_stats["cached"] += 1
+            return InputPeerChannel(peer[0], peer[1])
+
+    await _bucket.acquire()
+    entity = await client.get_entity(username)
+    peer_stats["resolved"] += 1
+    await db.set_channel_peer(username, entity.id, entity.access_hash)
+    return InputPeerChannel(entity.id, entity.access_hash)
+
+
+async def with_peer(username: str, call: Callable[[InputPeerChannel], Awaitable]):
+    peer = await get_input_peer(username)
     try:
-        entity = await client.get_entity(username)
-        message = await client.get_messages(entity, ids=message_id)
+        return await call(peer)
+    except (ChannelInvalidError, PeerIdInvalidError) as e:
+        # access hash устарел или канал пересоздан, резолвим заново
+        logger.warning(f"Сохранённый peer канала {username} недействителен: {e}")
+        return await call(await get_input_peer(username, refresh=True))
+
+
+async def get_media_message(username: str, message_id: int):
+    """Сообщение поста, если в нём есть фото или видео, иначе None."""
+    await ensure_connection()
+
+    message = await with_peer(
+        username, lambda peer: client.get_messages(peer, ids=message_id)
+    )
+    return message if is_valid_media(message) else None
 
-        if not is_valid_media(message):
-            return None, None, None
 
-        if not os.path.exists("downloads"):
-            os.makedirs("downloads")
+async def _download_part(document, index: int):
+    async for chunk in client.iter_download(
+        document,
+        offset=index * DOWNLOAD_PART_SIZE,
+        request_size=DOWNLOAD_PART_SIZE,
+        limit=1,
+        file_size=document.size,
+    ):
+        return chunk
+    return b""
+
+
+def iter_media(message: Message):
+    """Файл видео по частям в исходном порядке, без записи на диск.
+
+    Большие файлы качаются DOWNLOAD_WORKERS запросами одновременно: скорость
+    одного потока ограничена задержкой на каждую часть, а не каналом.
+    """
+    document = message.document
+    if config.DOWNLOAD_WORKERS <= 1 or document.size < PARALLEL_MIN_SIZE:
+        return client.iter_download(document, request_size=DOWNLOAD_PART_SIZE)
+
+    parts = -(-document.size // DOWNLOAD_PART_SIZE)
+    return fetch_parallel(
+        lambda index: _download_part(document, index),
+        parts,
+        config.DOWNLOAD_WORKERS,
+    )
+
+
+async def download_media_bytes(message: Message):
+    return await client.download_media(message, file=bytes)
+
+
+async def download_media_from_post(username: str, message_id: int):
+    """Файл берётся из кэша загрузок или докачивается в него. Путь отдать в downloads.release."""
+    try:
+        message = await get_media_message(username, message_id)
+        if not message:
+            return None, None, None
 
         media_type = "video" if message.video else "photo"
-        path = await client.download_media(message, file="downloads/")
         caption = message.text or ""
+        key = downloads.media_key(message)
+
+        path = downloads.acquire(key)
+        if path:
+            logger.info(f"Файл {path} взят из кэша загрузок.")
+            return path, caption, media_type
+
+        temp = downloads.temp_path(key)
+        try:
+            if message.video:
+                with open(temp, "wb") as f:
+                    async for chunk in iter_media(message):
+                        f.write(chunk)
+                downloaded = temp
+            else:
+                downloaded = await client.download_media(message, file=temp)
+            if not downloaded:
+                return None, None, None
+            path = downloads.commit(key, downloaded)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
 
         logger.info(f"Установка файла {path}, тип {media_type}.")
 
@@ -72,7 +298,7 @@ async def check_channel_and_get_preview(username: str):
         entity = await client.get_entity(username)
 
         if not isinstance(entity, Channel) or entity.megagroup:
-            return False, "Это не канал.", None, None
+            return False, "Это не канал.", None, None, False
 
         messages_ids = []
         async for msg in client.iter_messages(entity, limit=20):
@@ -85,38 +311,170 @@ async def check_channel_and_get_preview(username: str):
             await asyncio.sleep(0.2)
 
         if not messages_ids:
-            return False, "Канал пуст или нет постов с фото/видео.", None, None
+            return False, "Канал пуст или нет постов с фото/видео.", None, None, False
 
-        return True, messages_ids, entity.title, entity.id
+        return True, messages_ids, entity.title, entity.id, bool(entity.noforwards)
     except ValueError:
-        return False, "Неверный username.", None, None
+        return False, "Неверный username.", None, None, False
     except Exception as e:
         logger.error(f"Ошибка проверки канала: {e}", exc_info=True)
-        return False, f"Ошибка: {e}", None, None
+        return False, f"Ошибка: {e}", None, None, False
+
+
+async def resolve_channel(username: str, tg_id: int | None):
+    try:
+        entity = await with_peer(username, client.get_entity)
+    except Exception:
+        if not tg_id:
+            raise
+        # По числовому id канал находится даже после смены username
+        entity = await client.get_entity(PeerChannel(tg_id))
+        await db.set_channel_peer(username, entity.id, entity.access_hash)
 
+    if entity.username and entity.username != username:
+        logger.info(f"Канал {username} сменил username на {entity.username}.")
+        await db.rename_channel(entity.id, entity.username)
+        username = entity.username
 
-async def full_parse(username: str):
+    # Защиту от копирования могут включить в любой момент, обновляем при каждом парсинге
+    await db.set_channel_protection(username, bool(entity.noforwards))
+    return entity
+
+
+async def get_last_message_id(username: str):
     await ensure_connection()
 
-    logger.info(f"Запуск полного парсинга канала {username}.")
-    entity = await client.get_entity(username)
-    last_id = 0
-    count = 0
+    await _bucket.acquire()
+    messages = await with_peer(
+        username, lambda peer: client.get_messages(peer, limit=1)
+    )
+    return messages[0].id if messages else 0
 
-    async for msg in client.iter_messages(entity, reverse=True):
-        if not is_valid_media(msg):
-            continue
 
-        await db.add_post(username, msg.id)
+async def full_parse(
+    username: str,
+    min_id: int = 0,
+    on_chunk: Callable[[int, int, int], Awaitable[None]] | None = None,
+):
+    """Парсит историю канала после min_id, сохраняя offset после каждого чанка.
+
+    on_chunk(last_id, scanned, added) вызывается после каждого сохранения.
+    При ошибке сохранения бросает RuntimeError, прогресс до неё уже в БД.
+    """
+    await ensure_connection()
+
+    logger.info(f"Запуск полного парсинга канала {username} с поста {min_id}.")
+    await _bucket.acquire()
+    entity = await with_peer(username, client.get_entity)
+    await db.set_channel_protection(username, bool(entity.noforwards))
+    last_id = min_id
+    count = 0
+    scanned = 0
+    buffer: list[PostMeta] = []
+
+    async def flush():
+        nonlocal count, scanned, buffer
+        posts = await dedup.filter_duplicates(username, group_albums(buffer))
+        stored = await db.add_posts(username, posts, last_id)
+        if stored is None:
+            raise RuntimeError(f"Полный парсинг {username} прерван на посте {last_id}.")
+        dedup.remember(stored)
+        if on_chunk:
+            await on_chunk(last_id, scanned, len(posts))
+        count += len(posts)
+        scanned = 0
+        buffer = []
+
+    async for msg in client.iter_messages(entity, min_id=min_id, reverse=True):
+        # Чекпоинт по числу просмотренных сообщений, альбом между чанками не рвём
+        if scanned >= PARSE_CHUNK_SIZE and not continues_album(buffer, msg):
+            await flush()
+
+        scanned += 1
+        if scanned % PARSE_PAGE_SIZE == 0:
+            await _bucket.acquire()
+
         last_id = msg.id
-        count += 1
-        await asyncio.sleep(0.2)
+        if is_valid_media(msg):
+            buffer.append(post_meta(msg))
+
+    if scanned:
+        await flush()
 
-    await db.update_channel_offset(username, last_id)
     logger.info(f"Полный парсинг {username} завершен. Добавлено {count} постов.")
+    return count
+
+
+async def _parse_channel_updates(job: ChannelJob, report: ParseReport):
+    await _bucket.acquire()
+    entity = await resolve_channel(job.username, job.tg_id)
+    job.username = entity.username or job.username
+    job.tg_id = entity.id
+
+    current_max_id = job.last_id
+    buffer: list[PostMeta] = []
+    scanned = 0
+
+    async def flush():
+        nonlocal buffer
+        grouped = group_albums(buffer)
+        posts = await dedup.filter_duplicates(job.username, grouped)
+        stored = await db.add_posts(job.username, posts, current_max_id)
+        if stored is None:
+            raise RuntimeError(f"Не удалось сохранить посты канала {job.username}")
+        dedup.remember(stored)
+        report.added += len(posts)
+        report.duplicates += len(grouped) - len(posts)
+        job.last_id = current_max_id
+        buffer = []
+
+    async for msg in client.iter_messages(entity, min_id=job.last_id, reverse=True):
+        if len(buffer) >= PARSE_CHUNK_SIZE and not continues_album(buffer, msg):
+            await flush()
+
+        scanned += 1
+        report.scanned += 1
+        if scanned % PARSE_PAGE_SIZE == 0:
+            await _bucket.acquire()
+
+        current_max_id = msg.id
+        if is_valid_media(msg):
+            buffer.append(post_meta(msg))
+
+    if current_max_id > job.last_id:
+        await flush()
+
+
+async def _daily_parse_channel(
+    job: ChannelJob, report: ParseReport, semaphore: asyncio.Semaphore
+):
+    async with semaphore:
+        for attempt in range(config.PARSE_RETRIES + 1):
+            try:
+                # Повтор продолжает с последнего сохранённого offset
+                await _parse_channel_updates(job, report)
+                return
+            except FloodWaitError as e:
+                report.flood_waits += 1
+                logger.warning(
+                    f"Flood wait {e.seconds} с при парсинге {job.username}, пауза клиента."
+                )
+                _bucket.pause(e.seconds)
+            except Exception as e:
+                logger.error(
+                    f"Ошибка парсинга канала {job.username} (попытка {attempt + 1}): {e}",
+                    exc_info=True,
+                )
+                if attempt < config.PARSE_RETRIES:
+                    await asyncio.sleep(PARSE_RETRY_DELAY * 2**attempt)
+
+        report.failed += 1
+        logger.error(f"Канал {job.username} пропущен до следующего парсинга.")
 
 
 async def daily_parse():
+    global last_report
+
     await ensure_connection()
 
     logger.info("Начало ежедневного парсинга каналов.")
@@ -125,21 +483,127 @@ async def daily_parse():
         logger.warning("Каналов в базе нет.")
         return
 
-    count = 0
-
-    for username, last_id in channels:
-        current_max_id = last_id
-
-        async for msg in client.iter_messages(username, min_id=last_id):
-            if msg.id > current_max_id:
-                current_max_id = msg.id
+    # Каналы с идущим бэкфиллом дойдут до конца истории сами
+    backfilling = {row[0] for row in await db.get_backfill_jobs("running") or []}
+    channels = [row for row in channels if row[0] not in backfilling]
+
+    report = ParseReport(channels=len(channels))
+    semaphore = asyncio.Semaphore(config.PARSE_CONCURRENCY)
+    await asyncio.gather(
+        *(
+            _daily_parse_channel(
+                ChannelJob(username, last_id, tg_id), report, semaphore
+            )
+            for username, last_id, tg_id in channels
+        )
+    )
+
+    last_report = report
+    # Новые каналы и посты меняют средние охваты каналов
+    ranking.invalidate()
+    logger.info(f"Ежедневный парсинг завершен: {report}.")
+    return report
+
+
+async def _get_messages_waiting(username: str, ids: list[int]):
+    """get_messages с ожиданием flood wait вместо ошибки."""
+    while True:
+        await _bucket.acquire()
+        try:
+            return await with_peer(
+                username, lambda peer: client.get_messages(peer, ids=ids)
+            )
+        except FloodWaitError as e:
+            logger.warning(f"Flood wait {e.seconds} с при проверке постов {username}.")
+            _bucket.pause(e.seconds)
+
+
+async def check_posts(username: str, posts: list[tuple[int, str | None]]):
+    """posts: (message_id, album_ids). Возвращает (id пропавших постов, свежие охваты живых).
+
+    Пропавшие: удалённые в канале или потерявшие медиа. Альбом пропал, только
+    если пропали все его части, а охваты у него сводятся по живым частям, как
+    в group_albums. Охваты — строки (message_id, views, forwards, reactions)
+    для db.update_posts_engagement.
+    """
+    await ensure_connection()
 
-            if is_valid_media(msg):
-                await db.add_post(username, msg.id)
-                count += 1
-            asyncio.sleep(0.2)
+    parts = {
+        message_id: [int(i) for i in album_ids.split(",")]
+        if album_ids
+        else [message_id]
+        for message_id, album_ids in posts
+    }
+    ids = sorted({i for part_ids in parts.values() for i in part_ids})
+    alive = {}
+    for start in range(0, len(ids), META_BATCH_SIZE):
+        chunk = ids[start : start + META_BATCH_SIZE]
+        messages = await _get_messages_waiting(username, chunk)
+        # Удалённые сообщения telethon отдаёт как None
+        for message_id, message in zip(chunk, messages):
+            if message and is_valid_media(message):
+                alive[message_id] = message
+
+    dead = []
+    engagement = []
+    for message_id, part_ids in parts.items():
+        messages = [alive[i] for i in part_ids if i in alive]
+        if not messages:
+            dead.append(message_id)
+            continue
+        engagement.append(
+            (
+                message_id,
+                reduce(_max_or_none, [m.views for m in messages]),
+                reduce(_max_or_none, [m.forwards for m in messages]),
+                reduce(_max_or_none, [count_reactions(m) for m in messages]),
+            )
+        )
+    return dead, engagement
+
+
+async def backfill_post_meta():
+    """Заполняет метаданные постов, сохранённых до их появления в схеме."""
+    await ensure_connection()
 
-        if current_max_id > last_id:
-            await db.update_channel_offset(username, current_max_id)
+    channels = await db.get_all_channels() or []
+    updated = 0
+    for username, _, _ in channels:
+        after_id = 0
+        while True:
+            ids = await db.get_posts_without_meta(username, after_id, META_BATCH_SIZE)
+            if not ids:
+                break
+            after_id = ids[-1]
+
+            await _bucket.acquire()
+            try:
+                messages = await with_peer(
+                    username, lambda peer: client.get_messages(peer, ids=ids)
+                )
+            except FloodWaitError as e:
+                logger.warning(f"Flood wait {e.seconds} с при сборе метаданных.")
+                _bucket.pause(e.seconds)
+                after_id = ids[0] - 1
+                continue
+            except Exception as e:
+                logger.error(
+                    f"Ошибка сбора метаданных канала {username}: {e}", exc_info=True
+                )
+                break
 
-    logger.info(f"Ежедневный парсинг завершен. Добавлено {count} постов.")
+            # Удалённые посты приходят как None и остаются без метаданных. Части
+            # альбома пишутся по отдельности с grouped_id: group_albums оставил бы
+            # лишние части без него, и collapse_albums не смог бы их склеить
+            metas = [post_meta(m) for m in messages if m and is_valid_media(m)]
+            stored = await db.add_posts(username, metas) if metas else None
+            if stored is not None:
+                updated += len(metas)
+                dedup.remember(stored)
+
+    collapsed = await db.collapse_albums(MEDIA_ALBUM) or []
+    dedup.forget(collapsed)
+    logger.info(
+        f"Метаданные заполнены для {updated} постов, склеено частей альбомов: {len(collapsed)}."
+    )
+    return updated
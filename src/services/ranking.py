@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import random
+from array import array
+from bisect import bisect_right
+
+from src.config_loader import config
+from src.database import core as db
+
+logger = logging.getLogger(__name__)
+
+BLEND_SETTING = "rank_blend"
+PICK_ATTEMPTS = 8
+
+# Пересылка и реакция говорят об интересе сильнее, чем просмотр
+FORWARD_WEIGHT = 10
+REACTION_WEIGHT = 3
+# Границы веса относительно среднего поста канала
+MIN_WEIGHT = 0.1
+MAX_WEIGHT = 10.0
+
+# Постов за один запрос при пересборке: между пачками цикл событий свободен
+ENGAGEMENT_BATCH_SIZE = 10_000
+
+# Параллельные массивы: id поста в БД и сумма весов всех постов до него включительно.
+# array вместо list: на миллионе постов это 16 МБ против ~70 МБ объектов float и int
+_post_ids = array("q")
+_cumulative = array("d")
+# channel_id -> средний score поста канала на момент пересборки
+_channel_means: dict[int, float] = {}
+_last_id = 0
+_stale = True
+_rebuild_task: asyncio.Task | None = None
+
+# Доля рассылок (в процентах), где пост выбирается по охватам, а не случайно
+_blend: int | None = None
+
+
+def _score(views: int | None, forwards: int | None, reactions: int | None):
+    if views is None:
+        return None
+    return views + FORWARD_WEIGHT * (forwards or 0) + REACTION_WEIGHT * (reactions or 0)
+
+
+def _weight(means: dict[int, float], channel_id: int, score: float | None):
+    """Вес поста относительно среднего по его каналу: размер канала не важен."""
+    mean = means.get(channel_id)
+    if score is None or not mean:
+        return 1.0
+    return min(MAX_WEIGHT, max(MIN_WEIGHT, score / mean))
+
+
+def _extend(post_ids: array, cumulative: array, means: dict[int, float], rows: list):
+    total = cumulative[-1] if cumulative else 0.0
+    for post_id, channel_id, views, forwards, reactions in rows:
+        total += _weight(means, channel_id, _score(views, forwards, reactions))
+        post_ids.append(post_id)
+        cumulative.append(total)
+
+
+async def rebuild():
+    """Собирает индекс заново пачками по id и подменяет старый целиком.
+
+    Пока идёт сборка, выбор работает по старому индексу.
+    """
+    global _post_ids, _cumulative, _channel_means, _last_id, _stale
+
+    # Охваты, обновлённые во время сборки, снова пометят индекс устаревшим
+    _stale = False
+    rows = await db.get_channel_score_means(FORWARD_WEIGHT, REACTION_WEIGHT)
+    if rows is None:
+        _stale = True
+        return
+    means = dict(rows)
+
+    post_ids = array("q")
+    cumulative = array("d")
+    last_id = 0
+    while True:
+        rows = await db.get_posts_engagement(last_id, ENGAGEMENT_BATCH_SIZE)
+        if rows is None:
+            _stale = True
+            return
+        if not rows:
+            break
+        _extend(post_ids, cumulative, means, rows)
+        last_id = rows[-1][0]
+
+    _post_ids, _cumulative, _channel_means, _last_id = (
+        post_ids,
+        cumulative,
+        means,
+        last_id,
+    )
+    logger.info(
+        f"Индекс рейтинга пересобран: {len(_post_ids)} постов, "
+        f"{len(_channel_means)} каналов с охватами."
+    )
+
+
+def invalidate():
+    """Полная пересборка при следующем выборе (после обновления охватов)."""
+    global _stale
+    _stale = True
+
+
+async def _refresh():
+    global _last_id, _rebuild_task
+
+    if _rebuild_task and not _rebuild_task.done():
+        return
+    if _stale:
+        # Пересборка идёт в фоне: рассылка не ждёт прохода по всей таблице
+        _rebuild_task = asyncio.create_task(rebuild())
+        return
+
+    # Новые посты дописываются в конец с весом по уже посчитанным средним
+    after_id = _last_id
+    rows = await db.get_posts_engagement(after_id, ENGAGEMENT_BATCH_SIZE)
+    # Индекс могли подменить, пока шёл запрос
+    if rows and after_id == _last_id:
+        _extend(_post_ids, _cumulative, _channel_means, rows)
+        _last_id = rows[-1][0]
+
+
+async def pick_ranked():
+    """Пост по охватам или None, пока индекс пуст (первая сборка ещё идёт)."""
+    await _refresh()
+
+    for _ in range(PICK_ATTEMPTS):
+        if not _cumulative:
+            return None
+        index = bisect_right(_cumulative, random.random() * _cumulative[-1])
+        post = await db.get_post_by_id(_post_ids[min(index, len(_post_ids) - 1)])
+        if post:
+            return post
+        # Пост удалили после пересборки, в следующий раз индекс соберётся заново
+        invalidate()
+    return None
+
+
+async def get_blend():
+    global _blend
+
+    if _blend is None:
+        value = await db.get_setting(BLEND_SETTING)
+        _blend = int(value) if value is not None else config.RANK_BLEND
+    return _blend
+
+
+async def set_blend(percent: int):
+    global _blend
+
+    if await db.set_setting(BLEND_SETTING, str(percent)):
+        _blend = percent
+        return True
+    return False
+
+
+async def get_post():
+    """Пост для рассылки: по охватам с вероятностью blend %, иначе случайный."""
+    if random.random() * 100 < await get_blend():
+        post = await pick_ranked()
+        if post:
+            return post
+    return await db.get_random_post()
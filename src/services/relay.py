@@ -0,0 +1,79 @@
+import logging
+from typing import NamedTuple
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile
+from telethon.tl.types import Message
+
+from src.config_loader import config
+from src.services import downloads, parser
+from src.services.streams import buffered
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = parser.DOWNLOAD_PART_SIZE
+# Сколько чанков может ждать загрузки: не больше 4 МБ на поток
+STREAM_BUFFER_CHUNKS = 8
+
+
+class RelayMedia(NamedTuple):
+    file: InputFile
+    caption: str
+    media_type: str
+    # Путь в кэше загрузок, который нужно вернуть в downloads.release
+    cache_path: str | None = None
+
+
+class TelethonStreamFile(InputFile):
+    """Видео, которое качается из Telegram прямо в загрузку Bot API.
+
+    Каждое чтение начинает скачивание заново, поэтому повтор запроса
+    после сетевой ошибки отправляет файл целиком.
+    """
+
+    def __init__(self, message: Message, filename: str):
+        super().__init__(filename=filename, chunk_size=STREAM_CHUNK_SIZE)
+        self.message = message
+
+    async def read(self, bot: Bot):
+        source = parser.iter_media(self.message)
+        async for chunk in buffered(source, STREAM_BUFFER_CHUNKS):
+            yield chunk
+
+
+async def open_media(username: str, message_id: int):
+    """Медиа поста для загрузки через Bot API или None.
+
+    Уже скачанный файл берётся из кэша загрузок. В режиме stream фото
+    качается в память, видео передаётся потоком без записи на диск.
+    """
+    if config.RELAY_MODE != "stream":
+        path, caption, media_type = await parser.download_media_from_post(
+            username, message_id
+        )
+        if not path:
+            return None
+        return RelayMedia(FSInputFile(path), caption, media_type, path)
+
+    try:
+        message = await parser.get_media_message(username, message_id)
+        if not message:
+            return None
+
+        caption = message.text or ""
+        key = downloads.media_key(message)
+        path = downloads.acquire(key)
+        if path:
+            logger.info(f"Файл {path} взят из кэша загрузок.")
+            media_type = "video" if message.video else "photo"
+            return RelayMedia(FSInputFile(path), caption, media_type, path)
+
+        if message.photo:
+            data = await parser.download_media_bytes(message)
+            return RelayMedia(BufferedInputFile(data, key), caption, "photo")
+
+        logger.info(f"Потоковая передача видео {message_id} канала {username}.")
+        return RelayMedia(TelethonStreamFile(message, key), caption, "video")
+    except Exception as e:
+        logger.error(f"Ошибка получения медиа {message_id}: {e}", exc_info=True)
+        return None
@@ -0,0 +1,71 @@
+import logging
+import time
+
+from src.config_loader import config
+from src.database import core as db
+
+logger = logging.getLogger(__name__)
+
+# user_id -> (is_admin, время истечения)
+_roles: dict[int, tuple[bool, float]] = {}
+_admins: tuple[list[int], float] | None = None
+
+stats = {"hits": 0, "misses": 0}
+
+
+def invalidate(user_id: int | None = None):
+    global _admins
+
+    logger.debug(f"Сброс кэша ролей для {user_id or 'всех'}.")
+    if user_id is None:
+        _roles.clear()
+    else:
+        _roles.pop(user_id, None)
+    _admins = None
+
+
+async def is_admin(user_id: int):
+    cached = _roles.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        stats["hits"] += 1
+        return cached[0]
+
+    stats["misses"] += 1
+    result = await db.is_admin(user_id)
+    if result is None:
+        return False
+
+    _roles[user_id] = (result, time.monotonic() + config.ROLE_CACHE_TTL)
+    return result
+
+
+async def has_admin_rights(user_id: int):
+    if user_id == int(config.SUPER_ADMIN_ID):
+        return True
+    return await is_admin(user_id)
+
+
+async def get_admins():
+    global _admins
+
+    if _admins and _admins[1] > time.monotonic():
+        stats["hits"] += 1
+        return list(_admins[0])
+
+    stats["misses"] += 1
+    admins = await db.get_admins()
+    if admins is None:
+        return []
+
+    _admins = (admins, time.monotonic() + config.ROLE_CACHE_TTL)
+    return list(admins)
+
+
+async def add_admin(user_id: int):
+    await db.add_admin(user_id)
+    invalidate(user_id)
+
+
+async def remove_admin(user_id: int):
+    await db.remove_admin(user_id)
+    invalidate(user_id)
@@ -1,144 +1,868 @@
 import asyncio
 import logging
-import os
+import math
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
 from aiogram import Bot
-from aiogram.types import FSInputFile
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import InputFile, InputMediaPhoto, InputMediaVideo
 
+from src.config_loader import config
 from src.database import core as db
-from src.keyboards.keyboards import get_delete_post_kb
-from src.services import parser
+from src.keyboards.keyboards import get_delete_post_kb, get_post_kb
+from src.services import dedup, downloads, parser, ranking, relay
+from src.services.limiter import ChatRateLimiter, TokenBucket
 
 logger = logging.getLogger(__name__)
 
+PROGRESS_LOG_INTERVAL = 60
+# Длина слота плавной рассылки, секунд
+SPREAD_SLOT = 60
+# Плановая рассылка заканчивается за BROADCAST_MARGIN секунд до следующего часа.
+# Новые доставки не начинаются за SPREAD_DRAIN секунд до этого, начатые получают
+# это время на завершение, оставшиеся отменяются
+BROADCAST_MARGIN = 2 * 60
+SPREAD_DRAIN = 60
+# Минутные слоты целиком помещаются в час до начала дренажа
+SPREAD_MAX_MINUTES = (3600 - BROADCAST_MARGIN - SPREAD_DRAIN) // SPREAD_SLOT
+RETRY_BASE_DELAY = 1.0
+CAPTION_LIMIT = 1024
+# Больше Bot API загрузить не даст, качать такой файл бессмысленно
+UPLOAD_LIMIT = 50 * 1024 * 1024
+# Нижняя оценка скорости загрузки: видео в режиме stream идёт со скоростью
+# скачивания из Telegram, и стандартных 60 с aiogram на 50 МБ не хватает
+UPLOAD_MIN_SPEED = 256 * 1024
+UPLOAD_MIN_TIMEOUT = 60
+# За сколько минут до слота готовить пост и сколько подготовка остаётся годной
+STAGE_MINUTES = 5
+STAGE_MAX_AGE = 30 * 60
+# Сколько раз выбирать другой пост, если выбранный пропал из канала
+STAGE_ATTEMPTS = 5
 
-async def broadcast_random_post(bot: Bot, specific_user_id: int | None = None):
-    post = await db.get_random_post()
-    if not post:
-        logger.warning("Рассылка отменена: база постов пуста.")
-        if specific_user_id:
-            await bot.send_message(specific_user_id, "База постов пуста!")
-        return
+# Классы ошибок Bot API при рассылке
+RETRY_AFTER = "retry_after"
+FORBIDDEN = "forbidden"
+TRANSIENT = "transient"
+FATAL = "fatal"
 
-    channel_username, msg_id = post
-    from_chat = f"@{channel_username}"
-    post_link = f"https://t.me/{channel_username}/{msg_id}"
+# Общий на все рассылки лимит Bot API (~30 сообщений в секунду). Без запаса
+# на всплеск: полный бакет дал бы в первую секунду вдвое больше лимита
+_bucket = TokenBucket(config.BROADCAST_RATE, capacity=1)
 
-    admin_ids = []
 
-    if specific_user_id:
-        users = [specific_user_id]
-        if await db.is_admin(specific_user_id):
-            admin_ids.append(specific_user_id)
-        logger.info(f"Рассылка для ID: {specific_user_id}")
-    else:
-        users = await db.get_active_users()
-        admin_ids = await db.get_admins()
-        logger.info(f"Рассылка для {len(users)} пользователей.")
+@dataclass
+class BroadcastStats:
+    total: int
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: float = 0.0
+    api_calls: int = 0
+    copy_failures: int = 0
+    copy_skipped: int = 0
+    # Секунд от старта до первой успешной доставки
+    first_delivery: float | None = None
+    # Секунда от старта -> вызовов Bot API за неё
+    calls_per_second: Counter = field(default_factory=Counter)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def count_call(self):
+        self.api_calls += 1
+        self.calls_per_second[int(self.elapsed)] += 1
+
+    @property
+    def done(self):
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def msgs_per_sec(self):
+        return self.api_calls / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def peak_rate(self):
+        return max(self.calls_per_second.values(), default=0)
+
+    def __str__(self):
+        return (
+            f"{self.done}/{self.total} (успешно {self.sent}, заблокировали "
+            f"{self.blocked}, ошибок {self.failed}), повторов {self.retries}, "
+            f"flood wait {self.flood_waits} ({self.flood_wait_seconds:.0f} с), "
+            f"{self.msgs_per_sec:.1f} сообщ/с (пик {self.peak_rate}), "
+            f"{self.elapsed:.1f} с"
+        )
 
-    if not users:
-        return
 
-    delete_kb = get_delete_post_kb(channel_username, msg_id)
+# Статистика идущей сейчас плановой рассылки (для /stats)
+current_stats: BroadcastStats | None = None
+# Пост, подготовленный к ближайшей плановой рассылке, и момент подготовки
+_staged: tuple["PostDelivery", float] | None = None
 
-    downloaded_file_path = None
-    cached_file_id = None
-    caption_cache = None
-    media_type_cache = None
 
-    success_count = 0
+def upload_timeout(file_size: int | None):
+    """Таймаут запроса, который загружает файл; без размера — как для UPLOAD_LIMIT."""
+    return max(
+        UPLOAD_MIN_TIMEOUT, math.ceil((file_size or UPLOAD_LIMIT) / UPLOAD_MIN_SPEED)
+    )
 
-    for user_id in users:
+
+def classify_error(e: Exception):
+    if isinstance(e, TelegramRetryAfter):
+        return RETRY_AFTER
+    if isinstance(e, TelegramForbiddenError):
+        return FORBIDDEN
+    if isinstance(e, TelegramBadRequest) and "chat not found" in str(e).lower():
+        return FORBIDDEN
+    if isinstance(e, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+
+def utf16_len(text: str):
+    """Длина в единицах UTF-16: так Telegram считает лимиты текста."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def fit_caption(caption: str | None):
+    """Подгоняет подпись под лимит Bot API, возвращает (подпись, parse_mode)."""
+    if not caption or utf16_len(caption) <= CAPTION_LIMIT:
+        return caption, "Markdown"
+
+    # Обрезка может разорвать разметку, поэтому длинную подпись шлём как текст.
+    # Эмодзи вне BMP занимают две единицы, половинку пары decode отбросит
+    encoded = caption.encode("utf-16-le")[: (CAPTION_LIMIT - 1) * 2]
+    cut = encoded.decode("utf-16-le", errors="ignore")
+    cut = cut.rsplit(maxsplit=1)[0] if " " in cut or "\n" in cut else cut
+    return cut + "…", None
+
+
+def get_file_id(message):
+    if not message:
+        return None
+    if message.video:
+        return message.video.file_id
+    if message.photo:
+        return message.photo[-1].file_id
+    return None
+
+
+def build_input_media(media, media_type: str, caption: str | None):
+    caption, parse_mode = fit_caption(caption)
+    if media_type == "video":
+        return InputMediaVideo(media=media, caption=caption, parse_mode=parse_mode)
+    return InputMediaPhoto(media=media, caption=caption, parse_mode=parse_mode)
+
+
+class PostDelivery:
+    """Доставка одного поста: общий для всех воркеров кэш file_id и файла."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        channel_username: str,
+        msg_id: int,
+        protected: bool = False,
+        meta: dict | None = None,
+    ):
+        self.bot = bot
+        self.channel_username = channel_username
+        self.msg_id = msg_id
+        self.from_chat = f"@{channel_username}"
+        self.post_link = f"https://t.me/{channel_username}/{msg_id}"
+        self.meta = meta or {}
+        album_ids = self.meta.get("album_ids")
+        self.album_ids = [int(i) for i in album_ids.split(",")] if album_ids else None
+
+        # В режиме одного сообщения ссылка и кнопка удаления идут в самом посте.
+        # К альбому клавиатуру не прикрепить, для него ссылка идёт отдельно
+        self.single_message = config.BROADCAST_SINGLE_MESSAGE and not self.album_ids
+        if self.single_message:
+            self.post_kb = get_post_kb(channel_username, msg_id)
+        else:
+            self.post_kb = None
+        self.delete_kb = get_delete_post_kb(channel_username, msg_id)
+
+        self.limiter = ChatRateLimiter(_bucket, config.BROADCAST_CHAT_INTERVAL)
+        self.stats: BroadcastStats | None = None
+        # Сколько заняли выбор поста, его проверка и прогрев кэшей
+        self.prepare_seconds = 0.0
+
+        # Для защищённого канала сразу идём в обход copy_message
+        self.copy_failed = protected
+        self.download_failed = False
+        self.media_file: InputFile | None = None
+        self.cached_file_id: str | None = None
+        # file_id дошёл хотя бы до одного юзера, дальше его шлют без блокировки
+        self.file_id_confirmed = False
+        self.media_cache_checked = False
+        self.raw_caption: str | None = None
+        self.caption_cache: str | None = None
+        self.caption_parse_mode: str | None = "Markdown"
+        self.media_type_cache: str | None = None
+        # Готовый к повторной отправке альбом из file_id
+        self.album_media: list | None = None
+        # Файлы из кэша загрузок, которые держит эта рассылка
+        self.cache_paths: list[str] = []
+        self._upload_lock = asyncio.Lock()
+
+    async def prepare(self):
+        """Проверка поста и прогрев кэшей до рассылки. False, если пост пропал."""
         try:
-            message_sent = False
+            message = await parser.get_media_message(self.channel_username, self.msg_id)
+        except Exception as e:
+            # Не смогли проверить — не повод отменять рассылку
+            logger.warning(
+                f"Не удалось проверить пост {self.msg_id} канала {self.channel_username}: {e}"
+            )
+            return True
 
-            # Если есть File ID (копирование не сработало)
-            if cached_file_id:
-                if media_type_cache == "video":
-                    await bot.send_video(
-                        user_id,
-                        cached_file_id,
-                        caption=caption_cache,
-                        parse_mode="Markdown",
-                    )
-                elif media_type_cache == "photo":
-                    await bot.send_photo(
-                        user_id,
-                        cached_file_id,
-                        caption=caption_cache,
-                        parse_mode="Markdown",
-                    )
-                message_sent = True
+        if not message:
+            logger.warning(
+                f"Пост {self.msg_id} канала {self.channel_username} пропал из источника."
+            )
+            return False
 
-            # Пробуем стандартное копирование
-            if not message_sent:
-                try:
-                    await bot.copy_message(
-                        chat_id=user_id, from_chat_id=from_chat, message_id=msg_id
+        if message.noforwards:
+            self.copy_failed = True
+        if not self.copy_failed:
+            # copy_message не требует ничего, кроме живого поста
+            return True
+
+        # Для обхода защиты заранее скачиваем всё, чего нет в кэше file_id
+        for message_id in self.album_ids or [self.msg_id]:
+            if await db.get_media_cache(self.channel_username, message_id):
+                continue
+            file_size = self.meta.get("file_size")
+            if not self.album_ids and file_size and file_size > UPLOAD_LIMIT:
+                break
+            path, _, _ = await parser.download_media_from_post(
+                self.channel_username, message_id
+            )
+            if path:
+                self.cache_paths.append(path)
+        return True
+
+    def close(self):
+        # Файлы остаются в кэше загрузок до вытеснения
+        for path in self.cache_paths:
+            downloads.release(path)
+        self.cache_paths = []
+
+    async def _call(self, user_id: int, method, *args, **kwargs):
+        """Вызов Bot API через лимитер с повторами на flood wait и сетевых сбоях."""
+        attempt = 0
+        while True:
+            await self.limiter.wait(user_id)
+            if self.stats:
+                self.stats.count_call()
+
+            try:
+                return await method(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind not in (RETRY_AFTER, TRANSIENT):
+                    raise
+                if attempt >= config.BROADCAST_RETRIES:
+                    raise
+
+                attempt += 1
+                if self.stats:
+                    self.stats.retries += 1
+
+                if isinstance(e, TelegramRetryAfter):
+                    logger.warning(
+                        f"Flood wait {e.retry_after} с на юзере {user_id}, рассылка на паузе."
                     )
-                    message_sent = True
-                except Exception as e:
+                    if self.stats:
+                        self.stats.flood_waits += 1
+                        self.stats.flood_wait_seconds += e.retry_after
+                    # Пауза для всего пайплайна, а не только для этого воркера
+                    _bucket.pause(e.retry_after)
+                else:
+                    delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
                     logger.warning(
-                        f"Ошибка копирования для {user_id}. Переход на альтернативную отправку: {e}"
+                        f"Временная ошибка для {user_id}, повтор {attempt} через {delay} с: {e}"
                     )
+                    await asyncio.sleep(delay)
+
+    async def _send_cached(
+        self, user_id: int, media, request_timeout: int | None = None
+    ):
+        if self.media_type_cache == "video":
+            return await self._call(
+                user_id,
+                self.bot.send_video,
+                user_id,
+                media,
+                caption=self.caption_cache,
+                parse_mode=self.caption_parse_mode,
+                reply_markup=self.post_kb,
+                request_timeout=request_timeout,
+            )
+        elif self.media_type_cache == "photo":
+            return await self._call(
+                user_id,
+                self.bot.send_photo,
+                user_id,
+                media,
+                caption=self.caption_cache,
+                parse_mode=self.caption_parse_mode,
+                reply_markup=self.post_kb,
+                request_timeout=request_timeout,
+            )
+
+    async def _send_fallback(self, user_id: int):
+        if not self.file_id_confirmed:
+            # Пока file_id не подтверждён доставкой, отправки идут по одной:
+            # файл загружается не больше раза, остальные воркеры ждут file_id
+            async with self._upload_lock:
+                if not self.file_id_confirmed:
+                    return await self._send_first(user_id)
+
+        await self._send_cached(user_id, self.cached_file_id)
+        return True
+
+    async def _send_first(self, user_id: int):
+        # Ошибка юзера на file_id из кэша пробрасывается без отметки о проверке:
+        # следующий юзер снова получит тот же file_id, а не новую загрузку
+        if not self.media_cache_checked and await self._send_from_media_cache(user_id):
+            return True
+
+        if self.download_failed:
+            return False
+
+        file_size = self.meta.get("file_size")
+        if file_size and file_size > UPLOAD_LIMIT:
+            self.download_failed = True
+            logger.warning(
+                f"Пост {self.msg_id} канала {self.channel_username} "
+                f"весит {file_size} байт, загрузка через Bot API невозможна."
+            )
+            return False
+
+        if not self.media_file:
+            media = await relay.open_media(self.channel_username, self.msg_id)
+            if not media:
+                self.download_failed = True
+                logger.error(
+                    f"Ошибка альтернативной отправки поста {self.msg_id}",
+                    exc_info=True,
+                )
+                return False
+
+            self.media_file = media.file
+            if media.cache_path:
+                self.cache_paths.append(media.cache_path)
+            self.raw_caption = media.caption
+            self.caption_cache, self.caption_parse_mode = fit_caption(media.caption)
+            self.media_type_cache = media.media_type
+
+        sent_msg = await self._send_cached(
+            user_id, self.media_file, upload_timeout(file_size)
+        )
+        file_id = get_file_id(sent_msg)
+        if file_id and self.media_type_cache:
+            self.cached_file_id = file_id
+            self.file_id_confirmed = True
+            await db.set_media_cache(
+                self.channel_username,
+                self.msg_id,
+                file_id,
+                self.media_type_cache,
+                self.raw_caption,
+            )
+        return True
 
-                    if not downloaded_file_path:
-                        path, cap, m_type = await parser.download_media_from_post(
-                            channel_username, msg_id
-                        )
-                        if path:
-                            downloaded_file_path = path
-                            caption_cache = cap
-                            media_type_cache = m_type
-                        else:
-                            logger.error(
-                                f"Ошибка альтернативной отправки поста {msg_id}",
-                                exc_info=True,
+    async def _send_from_media_cache(self, user_id: int):
+        """Отправка по file_id из media_cache. Исключения юзера пробрасываются."""
+        if not self.cached_file_id:
+            cached = await db.get_media_cache(self.channel_username, self.msg_id)
+            if not cached:
+                self.media_cache_checked = True
+                return False
+
+            self.cached_file_id, self.media_type_cache, self.raw_caption = cached
+            self.caption_cache, self.caption_parse_mode = fit_caption(self.raw_caption)
+
+        try:
+            await self._send_cached(user_id, self.cached_file_id)
+        except TelegramBadRequest as e:
+            # chat not found относится к юзеру, а не к file_id
+            if classify_error(e) != FATAL:
+                raise
+            # file_id мог протухнуть (например, сменили токен бота)
+            logger.warning(
+                f"file_id поста {self.msg_id} канала {self.channel_username} недействителен: {e}"
+            )
+            await db.delete_media_cache(self.channel_username, self.msg_id)
+            self.cached_file_id = None
+            self.media_cache_checked = True
+            return False
+
+        self.file_id_confirmed = True
+        return True
+
+    async def _send_album_fallback(self, user_id: int):
+        if self.album_media is None:
+            async with self._upload_lock:
+                if self.album_media is None:
+                    if self.download_failed:
+                        return False
+                    return await self._upload_album(user_id)
+
+        if len(self.album_media) == 1:
+            await self._send_cached(user_id, self.cached_file_id)
+        else:
+            await self._call(
+                user_id, self.bot.send_media_group, user_id, self.album_media
+            )
+        return True
+
+    async def _upload_album(self, user_id: int):
+        assert self.album_ids is not None
+        # (message_id, file_id или файл, тип, подпись, загружается ли впервые)
+        items = []
+        for message_id in self.album_ids:
+            cached = await db.get_media_cache(self.channel_username, message_id)
+            if cached:
+                file_id, media_type, caption = cached
+                items.append((message_id, file_id, media_type, caption, False))
+                continue
+
+            media = await relay.open_media(self.channel_username, message_id)
+            if not media:
+                logger.warning(
+                    f"Часть {message_id} альбома {self.msg_id} канала {self.channel_username} недоступна."
+                )
+                continue
+            if media.cache_path:
+                self.cache_paths.append(media.cache_path)
+            items.append(
+                (message_id, media.file, media.media_type, media.caption, True)
+            )
+
+        if not items:
+            self.download_failed = True
+            logger.error(f"Ошибка альтернативной отправки альбома {self.msg_id}")
+            return False
+
+        # Размер альбома в метаданных — сумма частей, без него считаем по лимиту
+        uploads = sum(uploaded for *_, uploaded in items)
+        file_size = self.meta.get("file_size") or uploads * UPLOAD_LIMIT
+        try:
+            # send_media_group принимает от 2 частей, одна уходит обычным постом
+            if len(items) == 1:
+                return await self._send_album_part(user_id, *items[0], file_size)
+
+            sent = await self._call(
+                user_id,
+                self.bot.send_media_group,
+                user_id,
+                [build_input_media(m, t, c) for _, m, t, c, _ in items],
+                request_timeout=upload_timeout(file_size) if uploads else None,
+            )
+        except Exception as e:
+            if classify_error(e) == FATAL:
+                if uploads < len(items):
+                    # Среди закэшированных file_id мог оказаться протухший:
+                    # следующий юзер загрузит эти части заново
+                    for message_id, _, _, _, uploaded in items:
+                        if not uploaded:
+                            await db.delete_media_cache(
+                                self.channel_username, message_id
                             )
-                            continue
-
-                    input_file = FSInputFile(downloaded_file_path)
-                    sent_msg = None
-
-                    if media_type_cache == "video":
-                        sent_msg = await bot.send_video(
-                            user_id,
-                            input_file,
-                            caption=caption_cache,
-                            parse_mode="Markdown",
-                        )
-                    elif media_type_cache == "photo":
-                        sent_msg = await bot.send_photo(
-                            user_id,
-                            input_file,
-                            caption=caption_cache,
-                            parse_mode="Markdown",
-                        )
-                    message_sent = True
-
-                    if sent_msg:
-                        if sent_msg.video:
-                            cached_file_id = sent_msg.video.file_id
-                        elif sent_msg.photo:
-                            cached_file_id = sent_msg.photo[-1].file_id
-
-            if message_sent:
-                success_count += 1
-                await bot.send_message(
-                    user_id,
-                    f"<a href='{post_link}'>Источник @{channel_username}</a>",
-                    reply_markup=delete_kb,
-                    parse_mode="HTML",
-                    disable_web_page_preview=True,
+                else:
+                    # Загрузка всех частей с нуля не удалась: не повторяем её
+                    # для каждого следующего юзера
+                    self.download_failed = True
+            raise
+
+        file_ids = [get_file_id(m) for m in sent]
+        for (message_id, _, media_type, caption, uploaded), file_id in zip(
+            items, file_ids
+        ):
+            if uploaded and file_id:
+                await db.set_media_cache(
+                    self.channel_username, message_id, file_id, media_type, caption
                 )
+
+        if len(file_ids) == len(items) and all(file_ids):
+            self.album_media = [
+                build_input_media(file_id, t, c)
+                for (_, _, t, c, _), file_id in zip(items, file_ids)
+            ]
+        return True
+
+    async def _send_album_part(
+        self,
+        user_id: int,
+        message_id: int,
+        media,
+        media_type: str,
+        caption: str,
+        uploaded: bool,
+        file_size: int | None,
+    ):
+        """Единственная доступная часть альбома: отправка как одиночного поста."""
+        self.media_type_cache = media_type
+        self.raw_caption = caption
+        self.caption_cache, self.caption_parse_mode = fit_caption(caption)
+
+        sent_msg = await self._send_cached(
+            user_id, media, upload_timeout(file_size) if uploaded else None
+        )
+        file_id = get_file_id(sent_msg)
+        if file_id:
+            if uploaded:
+                await db.set_media_cache(
+                    self.channel_username, message_id, file_id, media_type, caption
+                )
+            self.cached_file_id = file_id
+            self.album_media = [build_input_media(file_id, media_type, caption)]
+        return True
+
+    async def _send_post(self, user_id: int):
+        # Пробуем стандартное копирование, пока оно не упало
+        if self.copy_failed:
+            if self.stats:
+                self.stats.copy_skipped += 1
+        else:
+            try:
+                if self.album_ids:
+                    await self._call(
+                        user_id,
+                        self.bot.copy_messages,
+                        chat_id=user_id,
+                        from_chat_id=self.from_chat,
+                        message_ids=self.album_ids,
+                    )
+                else:
+                    await self._call(
+                        user_id,
+                        self.bot.copy_message,
+                        chat_id=user_id,
+                        from_chat_id=self.from_chat,
+                        message_id=self.msg_id,
+                        reply_markup=self.post_kb,
+                    )
+                return True
+            except Exception as e:
+                # Блокировка юзером или исчерпанные повторы не повод отключать копирование
+                if classify_error(e) != FATAL:
+                    raise
+                logger.warning(
+                    f"Ошибка копирования для {user_id}. Переход на альтернативную отправку: {e}"
+                )
+                self.copy_failed = True
+                if self.stats:
+                    self.stats.copy_failures += 1
+                if "protected" in str(e).lower():
+                    # Канал включил защиту после последнего парсинга
+                    await db.set_channel_protection(self.channel_username, True)
+
+        if self.album_ids:
+            return await self._send_album_fallback(user_id)
+        return await self._send_fallback(user_id)
+
+    async def deliver(self, user_id: int):
+        assert self.stats is not None
+        try:
+            if not await self._send_post(user_id):
+                self.stats.failed += 1
+                return
+
+            if not self.single_message:
+                await self._send_source(user_id)
+            self.stats.sent += 1
+            if self.stats.first_delivery is None:
+                self.stats.first_delivery = self.stats.elapsed
         except Exception as e:
+            if classify_error(e) == FORBIDDEN:
+                logger.info(f"Юзер {user_id} недоступен, отключаю рассылку: {e}")
+                await db.set_user_active(user_id, False)
+                self.stats.blocked += 1
+                return
+
             logger.error(f"Не удалось отправить юзеру {user_id}: {e}", exc_info=True)
-            await db.set_user_active(user_id, False)
+            self.stats.failed += 1
+
+    async def _send_source(self, user_id: int):
+        await self._call(
+            user_id,
+            self.bot.send_message,
+            user_id,
+            f"<a href='{self.post_link}'>Источник @{self.channel_username}</a>",
+            reply_markup=self.delete_kb,
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+        )
+
+    async def _deliver_all(self, users: list[int]):
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for user_id in users:
+            queue.put_nowait(user_id)
+
+        async def worker():
+            while True:
+                try:
+                    user_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                await self.deliver(user_id)
+
+        workers_count = max(1, min(config.BROADCAST_WORKERS, len(users)))
+        await asyncio.gather(*(worker() for _ in range(workers_count)))
+
+    async def _deliver_spread(self, users: list[int], minutes: int, deadline: float):
+        """Каждый юзер получает пост в свою минуту, внутри минуты — равномерно.
+
+        deadline — момент time.monotonic(), к которому рассылка должна закончиться.
+        """
+        assert self.stats is not None
+        buckets: list[list[int]] = [[] for _ in range(minutes)]
+        for user_id in users:
+            buckets[user_slot(user_id, minutes)].append(user_id)
+
+        semaphore = asyncio.Semaphore(config.BROADCAST_WORKERS)
+
+        async def deliver(user_id: int):
+            async with semaphore:
+                await self.deliver(user_id)
+
+        tasks: list[asyncio.Task] = []
+        started = time.monotonic()
+        stop_at = deadline - SPREAD_DRAIN
+        skipped = 0
+        try:
+            for minute, bucket in enumerate(buckets):
+                step = SPREAD_SLOT / len(bucket) if bucket else 0.0
+                for i, user_id in enumerate(bucket):
+                    at = started + minute * SPREAD_SLOT + i * step
+                    if max(at, time.monotonic()) >= stop_at:
+                        skipped += 1
+                        continue
+                    delay = at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    tasks.append(asyncio.create_task(deliver(user_id)))
+
+            pending: set[asyncio.Task] = set()
+            if tasks:
+                _, pending = await asyncio.wait(
+                    tasks, timeout=max(0.0, deadline - time.monotonic())
+                )
+            if skipped or pending:
+                # Не успевшие юзеры считаются неудачными, следующий час не сдвигается
+                self.stats.failed += skipped + len(pending)
+                logger.warning(
+                    f"Рассылка упёрлась в конец часа: не начаты {skipped}, "
+                    f"прерваны {len(pending)} доставок."
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(
+        self, users: list[int], spread_minutes: int = 0, deadline: float | None = None
+    ):
+        """Доставка всем users: разом или по минутным слотам в пределах spread_minutes.
+
+        Плавная рассылка без deadline должна закончиться через час после старта.
+        """
+        if self.stats is None:
+            self.stats = BroadcastStats(total=len(users))
+
+        async def progress():
+            while True:
+                await asyncio.sleep(PROGRESS_LOG_INTERVAL)
+                logger.info(f"Прогресс рассылки: {self.stats}")
+
+        progress_task = asyncio.create_task(progress())
+        try:
+            if spread_minutes > 0:
+                if deadline is None:
+                    deadline = time.monotonic() + 3600 - BROADCAST_MARGIN
+                await self._deliver_spread(users, spread_minutes, deadline)
+            else:
+                await self._deliver_all(users)
+        finally:
+            progress_task.cancel()
+            self.close()
+
+        return self.stats
+
+
+def user_slot(user_id: int, slots: int):
+    """Постоянная минута рассылки юзера: crc32 не зависит от запуска и порядка id."""
+    return zlib.crc32(str(user_id).encode()) % slots
+
+
+async def _pick_delivery(bot: Bot):
+    post = await ranking.get_post()
+    if not post:
+        return None
+
+    channel_username, msg_id = post
+    protected = await db.is_channel_protected(channel_username)
+    meta = await db.get_post_meta(channel_username, msg_id)
+    return PostDelivery(bot, channel_username, msg_id, protected, meta)
+
+
+async def prepare_delivery(bot: Bot):
+    """Выбирает живой пост и прогревает кэши, None если постов нет."""
+    started = time.monotonic()
+    for _ in range(STAGE_ATTEMPTS):
+        delivery = await _pick_delivery(bot)
+        if not delivery:
+            return None
+
+        if await delivery.prepare():
+            delivery.prepare_seconds = time.monotonic() - started
+            return delivery
+
+        deleted = await db.delete_posts(delivery.channel_username, [delivery.msg_id])
+        dedup.forget(deleted or [])
+
+    logger.error("Не удалось подобрать живой пост для рассылки.")
+    return None
+
+
+async def stage_next_post(bot: Bot):
+    """Готовит пост к ближайшей плановой рассылке, пока до неё есть время."""
+    global _staged
+
+    if _staged:
+        _staged[0].close()
+        _staged = None
+
+    delivery = await prepare_delivery(bot)
+    if not delivery:
+        return
+
+    _staged = (delivery, time.monotonic())
+    logger.info(
+        f"Пост {delivery.msg_id} канала {delivery.channel_username} подготовлен "
+        f"к рассылке за {delivery.prepare_seconds:.1f} с."
+    )
+
+
+def _hour_deadline():
+    """Момент time.monotonic() за BROADCAST_MARGIN секунд до следующего часа."""
+    now = datetime.now()
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return time.monotonic() + (next_hour - now).total_seconds() - BROADCAST_MARGIN
+
+
+def _take_staged():
+    global _staged
+
+    staged, _staged = _staged, None
+    if not staged:
+        return None
+
+    delivery, staged_at = staged
+    if time.monotonic() - staged_at > STAGE_MAX_AGE:
+        # Подготовка к пропущенному слоту: пост мог устареть
+        delivery.close()
+        return None
+    return delivery
+
+
+async def broadcast_random_post(bot: Bot, specific_user_id: int | None = None):
+    global current_stats
+
+    if specific_user_id:
+        delivery = await _pick_delivery(bot)
+        staged = False
+    else:
+        delivery = _take_staged()
+        staged = delivery is not None
+        if not delivery:
+            # Подготовки не было, вся она ложится на начало рассылки
+            delivery = await prepare_delivery(bot)
+
+    if not delivery:
+        logger.warning("Рассылка отменена: база постов пуста.")
+        if specific_user_id:
+            await bot.send_message(specific_user_id, "База постов пуста!")
+        return
+
+    channel_username, msg_id = delivery.channel_username, delivery.msg_id
+
+    if specific_user_id:
+        users = [specific_user_id]
+        logger.info(f"Рассылка для ID: {specific_user_id}")
+    else:
+        users = await db.get_active_users() or []
+        logger.info(f"Рассылка для {len(users)} пользователей.")
+
+    if not users:
+        delivery.close()
+        return
+
+    if not specific_user_id:
+        current_stats = delivery.stats = BroadcastStats(total=len(users))
+
+    # Один пост в час: слоты и дренаж не выходят за час, начатый в 8-23
+    spread = (
+        0
+        if specific_user_id
+        else min(config.BROADCAST_SPREAD_MINUTES, SPREAD_MAX_MINUTES)
+    )
+    try:
+        stats = await delivery.run(users, spread, _hour_deadline())
+    finally:
+        if not specific_user_id:
+            current_stats = None
+
+    if stats.copy_failures or stats.copy_skipped:
+        await db.add_copy_stats(
+            channel_username, stats.copy_failures, stats.copy_skipped
+        )
 
-        await asyncio.sleep(0.05)
+    if not specific_user_id:
+        await db.add_broadcast(
+            channel_username,
+            msg_id,
+            total=stats.total,
+            sent=stats.sent,
+            blocked=stats.blocked,
+            failed=stats.failed,
+            retries=stats.retries,
+            flood_waits=stats.flood_waits,
+            flood_wait_seconds=stats.flood_wait_seconds,
+            duration=stats.elapsed,
+            prepare_duration=delivery.prepare_seconds,
+            staged=staged,
+            first_delivery=stats.first_delivery,
+            api_calls=stats.api_calls,
+            peak_rate=stats.peak_rate,
+        )
 
-    if downloaded_file_path and os.path.exists(downloaded_file_path):
-        os.remove(downloaded_file_path)
-        logger.info(f"Временный файл удален: {downloaded_file_path}")
+        # Задержка первой доставки от начала слота: без подготовки заранее
+        # в неё входит выбор поста и прогрев кэшей
+        if stats.first_delivery is not None:
+            on_path = 0.0 if staged else delivery.prepare_seconds
+            logger.info(
+                f"Подготовка поста {delivery.prepare_seconds:.1f} с "
+                f"({'заранее' if staged else 'в начале рассылки'}), первая доставка "
+                f"через {on_path + stats.first_delivery:.2f} с от начала слота."
+            )
 
-    logger.info(f"Рассылка завершена. Успешно: {success_count}/{len(users)}")
+    logger.info(f"Рассылка завершена. Успешно: {stats.sent}/{len(users)}. {stats}")
@@ -0,0 +1,62 @@
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+_DONE = object()
+
+
+async def buffered(source: AsyncIterator[bytes], max_chunks: int):
+    """Читает source в фоне, держа в памяти не больше max_chunks чанков.
+
+    Скачивание и загрузка идут одновременно, медленная сторона притормаживает
+    быструю, а память ограничена размером очереди.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+
+    async def produce():
+        try:
+            async for chunk in source:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_DONE)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+
+
+async def fetch_parallel(
+    fetch_part: Callable[[int], Awaitable[bytes]], parts: int, workers: int
+):
+    """Части 0..parts-1 по порядку, до workers запросов одновременно.
+
+    Впереди читателя скачано не больше 2 * workers частей, так что память
+    ограничена, а медленный потребитель притормаживает скачивание.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def fetch(index: int):
+        async with semaphore:
+            return await fetch_part(index)
+
+    pending: deque[asyncio.Task] = deque()
+    try:
+        for index in range(parts):
+            pending.append(asyncio.create_task(fetch(index)))
+            if len(pending) >= 2 * workers:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
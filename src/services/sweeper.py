@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+
+from src.config_loader import config
+from src.database import core as db
+from src.services import dedup, parser, ranking
+
+logger = logging.getLogger(__name__)
+
+# get_messages(ids=[...]) отдаёт до 100 сообщений за запрос. Части альбомов
+# check_posts добирает дополнительными запросами
+SWEEP_BATCH_SIZE = parser.META_BATCH_SIZE
+
+
+@dataclass
+class SweepReport:
+    posts: int = 0
+    checked: int = 0
+    removed: int = 0
+    failed: int = 0
+    # Время, потраченное на сами запросы, без пауз между пачками
+    busy: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def __str__(self):
+        per_hour = self.checked / self.elapsed * 3600 if self.elapsed else 0.0
+        per_sec = self.checked / self.busy if self.busy else 0.0
+        return (
+            f"проверено {self.checked}/{self.posts} постов, удалено {self.removed}, "
+            f"каналов с ошибкой {self.failed}, {per_hour:.0f} пост/ч "
+            f"({per_sec:.0f} пост/с без пауз), {self.elapsed / 3600:.1f} ч"
+        )
+
+
+# Идущий и последний завершённый проходы (для /stats)
+current_report: SweepReport | None = None
+last_report: SweepReport | None = None
+
+
+async def _sweep_channel(username: str, report: SweepReport, delay: float):
+    after_id = 0
+    while True:
+        posts = await db.get_post_parts(username, after_id, SWEEP_BATCH_SIZE)
+        if not posts:
+            return
+        after_id = posts[-1][0]
+
+        started = time.monotonic()
+        dead, engagement = await parser.check_posts(username, posts)
+        report.busy += time.monotonic() - started
+        report.checked += len(posts)
+        # Заодно освежаем охваты: посты из живого приёма сохраняются почти без просмотров
+        if engagement:
+            await db.update_posts_engagement(username, engagement)
+
+        if dead:
+            deleted = await db.delete_posts(username, dead) or []
+            dedup.forget(deleted)
+            report.removed += len(deleted)
+            logger.info(
+                f"Удалено {len(deleted)} постов канала {username}, пропавших из источника."
+            )
+
+        await asyncio.sleep(delay)
+
+
+async def sweep():
+    """Один проход по всем постам базы, растянутый на SWEEP_HOURS."""
+    global current_report, last_report
+
+    channels = await db.get_channels_stats() or []
+    batches = sum(math.ceil(row[1] / SWEEP_BATCH_SIZE) for row in channels)
+    # Редкие запросы не отнимают лимит telethon у парсинга и скачивания медиа
+    delay = config.SWEEP_HOURS * 3600 / max(1, batches)
+
+    report = current_report = SweepReport(posts=sum(row[1] for row in channels))
+    logger.info(
+        f"Проверка живости {report.posts} постов, пачек {batches}, пауза {delay:.1f} с."
+    )
+    for username, count, *_ in channels:
+        if not count:
+            continue
+        try:
+            await _sweep_channel(username, report, delay)
+        except Exception as e:
+            report.failed += 1
+            logger.error(
+                f"Ошибка проверки постов канала {username}: {e}", exc_info=True
+            )
+
+    current_report = None
+    last_report = report
+    ranking.invalidate()
+    logger.info(f"Проверка живости постов завершена: {report}.")
+    return report
+
+
+async def start():
+    if config.SWEEP_HOURS <= 0:
+        return
+
+    logger.info("Запуск фоновой проверки живости постов.")
+    while True:
+        started = time.monotonic()
+        await sweep()
+        # Маленькая база проходится быстрее, но проходов не больше одного за SWEEP_HOURS
+        rest = config.SWEEP_HOURS * 3600 - (time.monotonic() - started)
+        await asyncio.sleep(max(0.0, rest))
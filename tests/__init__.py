@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# config читается при импорте, а парсер создаёт сессию telethon в текущей
+# папке: тесты работают во временной папке со своей БД и без .env
+_workdir = tempfile.mkdtemp(prefix="shuffle-feed-tests-")
+os.chdir(_workdir)
+os.environ["DB_NAME"] = os.path.join(_workdir, "test.db")
+os.environ.setdefault("DB_TIMEOUT", "5")
+for _name in ("API_ID", "API_HASH", "BOT_TOKEN", "SUPER_ADMIN_ID"):
+    os.environ.setdefault(_name, "0")
@@ -0,0 +1,109 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from src.database import core as db
+from src.services import parser
+
+
+def album_part(message_id: int, grouped_id: int, views: int):
+    return SimpleNamespace(
+        id=message_id,
+        action=None,
+        photo=SimpleNamespace(sizes=[]),
+        video=None,
+        document=None,
+        file=SimpleNamespace(size=1000, duration=None, width=640, height=480),
+        grouped_id=grouped_id,
+        message="",
+        views=views,
+        forwards=0,
+        reactions=None,
+    )
+
+
+class FakeClient:
+    """Заглушка TelegramClient: get_messages по id сообщений канала."""
+
+    def __init__(self):
+        # tg_id канала -> {id сообщения: сообщение}
+        self.messages: dict[int, dict[int, SimpleNamespace]] = {}
+        self.usernames: dict[str, int] = {}
+
+    def add_channel(self, username: str, tg_id: int, messages: list):
+        self.usernames[username] = tg_id
+        self.messages[tg_id] = {m.id: m for m in messages}
+
+    def is_connected(self):
+        return True
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_entity(self, username: str):
+        # Каналы других тестов резолвятся в пустые
+        tg_id = self.usernames.get(username, hash(username) & 0xFFFF)
+        return SimpleNamespace(id=tg_id, access_hash=1, username=username)
+
+    async def get_messages(self, peer, ids: list[int]):
+        channel = self.messages.get(peer.channel_id, {})
+        return [channel.get(i) for i in ids]
+
+
+class BackfillMetaTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await db.init_db()
+        self.client = FakeClient()
+        patches = (
+            mock.patch.object(parser, "client", self.client),
+            mock.patch.object(parser, "_bucket", parser.TokenBucket(10_000)),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        # БД общая для всех тестов
+        await db.remove_channel("delta", 0)
+        await db.close_db()
+
+    async def get_posts(self, username: str):
+        async with db.get_db_connection(readonly=True) as conn:
+            async with conn.execute(
+                """
+                SELECT p.message_id, p.media_type, p.album_ids, p.file_size, p.views
+                FROM posts p
+                JOIN channels c ON c.id = p.channel_id
+                WHERE c.username = ?
+                ORDER BY p.message_id
+            """,
+                (username,),
+            ) as cursor:
+                return await cursor.fetchall()
+
+    async def test_albums_survive_backfill(self):
+        # 10-12: альбом, уже сведённый в одну запись; 20-21: альбом из старой
+        # базы, сохранённый частями без метаданных
+        parts = [album_part(i, 1, 100 + i) for i in (10, 11, 12)]
+        parts += [album_part(i, 2, 100 + i) for i in (20, 21)]
+        self.client.add_channel("delta", 2001, parts)
+        await db.add_channel("delta", 0)
+
+        collapsed = parser.group_albums([parser.post_meta(m) for m in parts[:3]])
+        self.assertIsNotNone(await db.add_posts("delta", collapsed))
+        for message_id in (20, 21):
+            await db.add_post("delta", message_id)
+
+        await parser.backfill_post_meta()
+
+        self.assertEqual(
+            await self.get_posts("delta"),
+            [
+                (10, parser.MEDIA_ALBUM, "10,11,12", 3000, 112),
+                (20, parser.MEDIA_ALBUM, "20,21", 2000, 121),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
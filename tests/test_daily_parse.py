@@ -0,0 +1,130 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import InputPeerChannel, PeerChannel
+
+from src.database import core as db
+from src.services import parser
+
+
+def media_message(message_id: int):
+    return SimpleNamespace(
+        id=message_id,
+        action=None,
+        photo=SimpleNamespace(sizes=[]),
+        video=None,
+        document=None,
+        file=SimpleNamespace(size=1000, duration=None, width=640, height=480),
+        grouped_id=None,
+        message="",
+        views=100,
+        forwards=1,
+        reactions=None,
+    )
+
+
+def text_message(message_id: int):
+    return SimpleNamespace(id=message_id, action=None, photo=None, video=None)
+
+
+class FakeClient:
+    """Заглушка TelegramClient: каналы с историей и ошибки на выбор."""
+
+    def __init__(self):
+        self.channels: dict[str, list] = {}
+        self.entities: dict[int, SimpleNamespace] = {}
+        # username -> id сообщения, перед которым один раз бросить FloodWaitError
+        self.flood_before: dict[str, int] = {}
+        self.broken: set[str] = set()
+        self.iter_calls: list[tuple[str, int]] = []
+
+    def add_channel(self, username: str, tg_id: int, messages: list):
+        self.channels[username] = messages
+        self.entities[tg_id] = SimpleNamespace(
+            id=tg_id, access_hash=tg_id * 10, username=username, noforwards=False
+        )
+
+    def is_connected(self):
+        return True
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_entity(self, peer):
+        if isinstance(peer, InputPeerChannel | PeerChannel):
+            return self.entities[peer.channel_id]
+        if peer in self.broken:
+            raise ValueError(f"No user has {peer} as username")
+        for entity in self.entities.values():
+            if entity.username == peer:
+                return entity
+        raise ValueError(f"No user has {peer} as username")
+
+    async def iter_messages(self, entity, min_id: int = 0, reverse: bool = False):
+        self.iter_calls.append((entity.username, min_id))
+        for message in self.channels[entity.username]:
+            if message.id <= min_id:
+                continue
+            if self.flood_before.get(entity.username) == message.id:
+                del self.flood_before[entity.username]
+                raise FloodWaitError(request=None, capture=0)
+            yield message
+
+
+class DailyParseTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await db.init_db()
+        self.client = FakeClient()
+        patches = (
+            mock.patch.object(parser, "client", self.client),
+            mock.patch.object(parser, "PARSE_RETRY_DELAY", 0),
+            mock.patch.object(parser, "_bucket", parser.TokenBucket(10_000)),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        await db.close_db()
+
+    async def test_flood_wait_stays_within_its_channel(self):
+        # alpha: 5 сообщений, одно без медиа
+        alpha = [media_message(i) for i in range(1, 6)]
+        alpha[2] = text_message(3)
+        self.client.add_channel("alpha", 1001, alpha)
+        # beta: 700 постов, flood wait после первого чанка из PARSE_CHUNK_SIZE
+        self.client.add_channel("beta", 1002, [media_message(i) for i in range(1, 701)])
+        self.client.flood_before["beta"] = 601
+        # gamma: username не резолвится ни с одной попытки
+        self.client.add_channel("gamma", 1003, [media_message(1)])
+        self.client.broken.add("gamma")
+
+        for username in ("alpha", "beta", "gamma"):
+            await db.add_channel(username, 0)
+
+        report = await parser.daily_parse()
+
+        assert report is not None
+        self.assertEqual(report.channels, 3)
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(report.flood_waits, 1)
+        # beta: 600 до flood wait и 200 после продолжения с offset 500
+        self.assertEqual(report.scanned, 5 + 600 + 200)
+        self.assertEqual(report.added, 4 + 500 + 200)
+
+        beta_calls = [
+            min_id for name, min_id in self.client.iter_calls if name == "beta"
+        ]
+        self.assertEqual(beta_calls, [0, parser.PARSE_CHUNK_SIZE])
+
+        offsets = {row[0]: row[1] for row in await db.get_all_channels() or []}
+        self.assertEqual(offsets, {"alpha": 5, "beta": 700, "gamma": 0})
+        self.assertEqual(await db.get_post_ids("alpha", 0, 10), [1, 2, 4, 5])
+        self.assertEqual(len(await db.get_post_ids("beta", 0, 1000) or []), 700)
+        self.assertEqual(await db.get_post_ids("gamma", 0, 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()